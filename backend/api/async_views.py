@@ -0,0 +1,245 @@
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.http import Http404
+from django.views import View
+from recipes.models import Ingredient, Tag
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from api.fragments import aget_fragment_generation, aget_fragments
+from api.middleware import measure_serialization
+from api.paginators import get_approximate_count
+from api.search import ingredient_index
+from api.serializers import RecipeSerializer
+from api.views import IngredientViewSet, RecipeViewSet, TagModelViewSet
+
+
+class AsyncReadView(View):
+    """
+    Базовое асинхронное представление для чтения под ASGI.
+    Запрос проходит те же этапы, что и в синхронном вьюсете
+    viewset_class: аутентификацию классами из настроек DRF,
+    проверку разрешений, ограничение частоты и выбор формата ответа.
+    GET обрабатывается в цикле событий, данные выбираются асинхронным
+    ORM. Остальные методы и редкие режимы (is_delegated) передаются
+    синхронному представлению viewset_class с отображением actions.
+    """
+    viewset_class = None
+    actions = None
+    sync_view = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(
+            sync_view=cls.viewset_class.as_view(cls.actions), **initkwargs
+        )
+        view.csrf_exempt = True
+        view.actions = cls.actions
+        return view
+
+    def is_delegated(self, request):
+        """ Запрос обслуживается синхронным представлением. """
+        return request.method != 'GET'
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.is_delegated(request):
+            return await sync_to_async(self.sync_view)(
+                request, *args, **kwargs
+            )
+        self.viewset = viewset = self.get_viewset(request, *args, **kwargs)
+        request = viewset.request = viewset.initialize_request(request)
+        try:
+            # Аутентификация, разрешения и ограничения частоты
+            # синхронные в DRF, они выполняются одним переходом в поток.
+            await sync_to_async(viewset.initial)(request, *args, **kwargs)
+            response = await self.get(request, *args, **kwargs)
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        return await self.render(
+            viewset.finalize_response(request, response, *args, **kwargs)
+        )
+
+    def get_viewset(self, request, *args, **kwargs):
+        """
+        Экземпляр синхронного вьюсета для запроса, настроенный так же,
+        как в ViewSetMixin.as_view: от него берутся аутентификация,
+        разрешения, кверисет, фильтры, пагинатор и контекст сериализаторов.
+        """
+        viewset = self.viewset_class()
+        viewset.action_map = self.actions
+        for method, action in self.actions.items():
+            setattr(viewset, method, getattr(viewset, action))
+        viewset.args = args
+        viewset.kwargs = kwargs
+        viewset.headers = viewset.default_response_headers
+        return viewset
+
+    async def render(self, response):
+        """
+        Рендеринг ответа DRF выбранным при согласовании рендерером.
+        JSON рендерится в цикле событий, остальные рендереры
+        (например, BrowsableAPIRenderer) обращаются к синхронному ORM
+        и выполняются в потоке.
+        """
+        if not isinstance(response, Response):
+            return response
+        if isinstance(response.accepted_renderer, JSONRenderer):
+            return response.render()
+        return await sync_to_async(response.render)()
+
+    async def paginate_queryset(self, paginator, queryset, request):
+        """
+        Асинхронный вариант PageNumberPagination.paginate_queryset:
+        количество объектов и страница выбираются асинхронным ORM.
+        """
+        django_paginator = paginator.django_paginator_class(
+            queryset, paginator.get_page_size(request)
+        )
+        count = await sync_to_async(get_approximate_count)(queryset)
+        if count is None:
+            count = await queryset.acount()
+        django_paginator.count = count
+        page_number = paginator.get_page_number(request, django_paginator)
+        if page_number in paginator.last_page_strings:
+            page_number = django_paginator.num_pages
+        try:
+            page = django_paginator.page(page_number)
+        except InvalidPage as exc:
+            raise exceptions.NotFound(paginator.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+        paginator.page = page
+        paginator.request = request
+        paginator.use_cursor = False
+        return [obj async for obj in page.object_list]
+
+    async def serialize_recipes(self, recipes, context):
+        """ Представления рецептов через кэш фрагментов RecipeSerializer. """
+        serializer = RecipeSerializer(context=context)
+        with measure_serialization():
+            fragments = await aget_fragments(
+                recipes,
+                serializer.build_fragment,
+                serializer.get_fragment_prefix()
+            )
+            return [
+                serializer.merge_fragment(recipe, fragment)
+                for recipe, fragment in zip(recipes, fragments)
+            ]
+
+
+class RecipeListView(AsyncReadView):
+    """
+    Асинхронный список рецептов с фильтрами RecipeViewSet
+    и постраничной пагинацией. Пагинация по ключу (cursor)
+    обслуживается синхронным RecipeViewSet.
+    """
+    viewset_class = RecipeViewSet
+    actions = {'get': 'list', 'post': 'create'}
+
+    def is_delegated(self, request):
+        return (
+            super().is_delegated(request)
+            or RecipeViewSet.pagination_class.cursor_query_param
+            in request.GET
+        )
+
+    async def get(self, request):
+        viewset = self.viewset
+        queryset = await sync_to_async(viewset.filter_queryset)(
+            viewset.get_queryset()
+        )
+        recipes = await self.paginate_queryset(
+            viewset.paginator, queryset, request
+        )
+        data = await self.serialize_recipes(
+            recipes, viewset.get_serializer_context()
+        )
+        return viewset.get_paginated_response(data)
+
+
+class RecipeDetailView(AsyncReadView):
+    """ Асинхронное получение рецепта с поддержкой 304. """
+    viewset_class = RecipeViewSet
+    actions = {
+        'get': 'retrieve', 'patch': 'partial_update', 'delete': 'destroy'
+    }
+
+    async def get(self, request, pk):
+        viewset = self.viewset
+        version = await viewset.get_version_queryset(pk).afirst()
+        if version is None:
+            raise Http404
+
+        async def get_response():
+            recipe = await viewset.get_queryset().filter(pk=pk).afirst()
+            if recipe is None:
+                raise Http404
+            data, = await self.serialize_recipes(
+                [recipe], viewset.get_serializer_context()
+            )
+            return Response(data)
+
+        return await viewset.aconditional_response(
+            request,
+            viewset.format_recipe_version(
+                pk, version, await aget_fragment_generation()
+            ),
+            get_response
+        )
+
+
+class TagListView(AsyncReadView):
+    """ Асинхронный список тегов с поддержкой 304. """
+    viewset_class = TagModelViewSet
+    actions = {'get': 'list'}
+
+    async def get(self, request):
+        viewset = self.viewset
+
+        async def get_response():
+            tags = [tag async for tag in viewset.get_queryset()]
+            return Response(viewset.get_serializer(tags, many=True).data)
+
+        return await viewset.aconditional_response(
+            request,
+            f'tags-{await viewset.aget_model_version(Tag.objects.all())}',
+            get_response
+        )
+
+
+class IngredientListView(AsyncReadView):
+    """
+    Асинхронный список и поиск ингредиентов.
+    Поиск по началу названия обслуживается индексом в памяти,
+    нечеткий поиск в БД выполняется асинхронным ORM.
+    """
+    viewset_class = IngredientViewSet
+    actions = {'get': 'list'}
+
+    async def get(self, request):
+        viewset = self.viewset
+
+        async def get_response():
+            ingredients = [
+                ingredient async for ingredient in viewset.filter_queryset(
+                    viewset.get_queryset()
+                )
+            ]
+            return Response(
+                viewset.get_serializer(ingredients, many=True).data
+            )
+
+        name = request.query_params.get('name')
+        if name:
+            ingredients = await ingredient_index.asearch(name)
+            if ingredients:
+                return Response(
+                    viewset.get_serializer(ingredients, many=True).data
+                )
+            return await get_response()
+        version = await viewset.aget_model_version(Ingredient.objects.all())
+        return await viewset.aconditional_response(
+            request, f'ingredients-{version}', get_response
+        )
@@ -0,0 +1,128 @@
+import random
+import secrets
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from recipes.models import (FavoriteRecipes, Ingredient, IngredientQuantity,
+                            Recipe, ShoppingCart, Tag)
+from users.models import User, UserSubscription
+
+from api.search import (ingredient_index, recipe_ingredient_index,
+                        update_search_vectors)
+
+BATCH_SIZE = 1000
+SEED_PASSWORD = 'seed-password'
+MEASUREMENT_UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'по вкусу')
+WORDS = (
+    'томат', 'курица', 'сыр', 'рис', 'гречка', 'лук', 'морковь', 'свекла',
+    'картофель', 'яблоко', 'груша', 'молоко', 'сметана', 'укроп', 'чеснок',
+    'перец', 'говядина', 'тыква', 'капуста', 'грибы', 'лосось', 'мед',
+)
+
+
+def generate_data(users=500, recipes=3000, ingredients=1000, tags=10,
+                  ingredients_per_recipe=(3, 12), favorites_per_user=20,
+                  carts_per_user=5, subscriptions_per_user=10, seed=0,
+                  batch_size=BATCH_SIZE, stdout=None):
+    """
+    Генерация синтетических данных заданного объема пачками bulk_create.
+    Распределения задаются seed и воспроизводимы, а уникальные поля
+    получают случайный префикс, поэтому генерацию можно запускать
+    повторно на той же БД. Денормализованные счетчики, популярность,
+    поисковые векторы и индексы в памяти пересчитываются в конце.
+    Возвращает словарь с id созданных объектов.
+    """
+    rng = random.Random(seed)
+    prefix = secrets.token_hex(3)
+    password = make_password(SEED_PASSWORD)
+    created_users = User.objects.bulk_create([
+        User(
+            username=f'u{prefix}_{number}',
+            email=f'u{prefix}_{number}@example.com',
+            first_name=rng.choice(WORDS).title(),
+            last_name=rng.choice(WORDS).title(),
+            password=password,
+        )
+        for number in range(users)
+    ], batch_size=batch_size)
+    created_tags = Tag.objects.bulk_create([
+        Tag(
+            name=f't{prefix}_{number}',
+            color=f'#{prefix[:2]}{number:04x}'[:7],
+            slug=f't{prefix}_{number}',
+        )
+        for number in range(tags)
+    ], batch_size=batch_size)
+    created_ingredients = Ingredient.objects.bulk_create([
+        Ingredient(
+            name=f'{rng.choice(WORDS)} {prefix}{number}',
+            measurement_unit=rng.choice(MEASUREMENT_UNITS),
+        )
+        for number in range(ingredients)
+    ], batch_size=batch_size)
+    user_ids = [user.id for user in created_users]
+    created_recipes = Recipe.objects.bulk_create([
+        Recipe(
+            author_id=rng.choice(user_ids),
+            name=f'{rng.choice(WORDS).title()} {prefix} {number}',
+            text=' '.join(rng.choices(WORDS, k=30)),
+            image=f'media/{prefix}_{number}.png',
+            cooking_time=rng.randint(5, 120),
+        )
+        for number in range(recipes)
+    ], batch_size=batch_size)
+    recipe_ids = [recipe.id for recipe in created_recipes]
+    ingredient_ids = [ingredient.id for ingredient in created_ingredients]
+    tag_ids = [tag.id for tag in created_tags]
+    IngredientQuantity.objects.bulk_create([
+        IngredientQuantity(
+            recipe_id=recipe_id,
+            ingredient_id=ingredient_id,
+            amount=rng.randint(1, 500),
+        )
+        for recipe_id in recipe_ids
+        for ingredient_id in rng.sample(
+            ingredient_ids,
+            min(rng.randint(*ingredients_per_recipe), len(ingredient_ids))
+        )
+    ], batch_size=batch_size)
+    recipe_tags = Recipe.tags.through
+    recipe_tags.objects.bulk_create([
+        recipe_tags(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rng.sample(tag_ids, min(rng.randint(1, 3), tags))
+    ], batch_size=batch_size)
+    for model, per_user in (
+        (FavoriteRecipes, favorites_per_user),
+        (ShoppingCart, carts_per_user),
+    ):
+        model.objects.bulk_create([
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in rng.sample(
+                recipe_ids, min(per_user, len(recipe_ids))
+            )
+        ], batch_size=batch_size)
+    UserSubscription.objects.bulk_create([
+        UserSubscription(user_id=user_id, follow_to_id=author_id)
+        for user_id in user_ids
+        for author_id in rng.sample(
+            user_ids, min(subscriptions_per_user + 1, len(user_ids))
+        )[:subscriptions_per_user]
+        if author_id != user_id
+    ], batch_size=batch_size)
+    call_command('recount', stdout=stdout)
+    call_command('update_popularity', stdout=stdout)
+    call_command('rebuild_feeds', stdout=stdout)
+    if recipe_ids:
+        update_search_vectors(Recipe.objects.filter(
+            id__range=(min(recipe_ids), max(recipe_ids))
+        ))
+    ingredient_index.invalidate()
+    recipe_ingredient_index.invalidate()
+    return {
+        'users': user_ids,
+        'tags': tag_ids,
+        'ingredients': ingredient_ids,
+        'recipes': recipe_ids,
+    }
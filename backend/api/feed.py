@@ -0,0 +1,92 @@
+from heapq import merge
+
+from django.db.models import Q
+from recipes.constants import FEED_BACKFILL_SIZE, FEED_FANOUT_LIMIT
+from recipes.models import FeedEntry, Recipe
+from users.models import User, UserSubscription
+
+BATCH_SIZE = 1000
+
+
+def fan_out_recipe(recipe):
+    """
+    Добавление нового рецепта в ленты подписчиков автора.
+    Рецепты авторов, у которых больше FEED_FANOUT_LIMIT подписчиков,
+    не рассылаются, а подмешиваются в ленту при чтении.
+    """
+    followers = UserSubscription.objects.filter(
+        follow_to_id=recipe.author_id,
+        follow_to__followers_count__lte=FEED_FANOUT_LIMIT
+    ).values_list('user_id', flat=True)
+    entries = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        entries.append(FeedEntry(
+            user_id=user_id, recipe_id=recipe.pk, published=recipe.published
+        ))
+        if len(entries) == BATCH_SIZE:
+            FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+            entries = []
+    if entries:
+        FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def backfill_feed(user_id, author_id, size=FEED_BACKFILL_SIZE):
+    """ Добавление последних рецептов автора в ленту нового подписчика. """
+    recipes = Recipe.objects.filter(
+        author_id=author_id,
+        author__followers_count__lte=FEED_FANOUT_LIMIT
+    ).order_by(
+        '-published', '-id'
+    ).values_list('id', 'published')[:size]
+    FeedEntry.objects.bulk_create([
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, published=published)
+        for recipe_id, published in recipes
+    ], ignore_conflicts=True)
+
+
+def remove_from_feed(user_id, author_id):
+    """ Удаление рецептов автора из ленты отписавшегося пользователя. """
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def remove_author_from_feeds(author_id):
+    """ Удаление рецептов автора из лент всех пользователей. """
+    FeedEntry.objects.filter(recipe__author_id=author_id).delete()
+
+
+def get_feed_entries(user, position, limit):
+    """
+    Страница ленты пользователя в виде списка (published, id рецепта)
+    по убыванию даты публикации, начиная после position.
+    Записи ленты читаются по индексу (user, published, recipe),
+    рецепты крупных авторов выбираются отдельным запросом
+    и сливаются с ними без повторов.
+    """
+    entries = FeedEntry.objects.filter(user=user)
+    recipes = Recipe.objects.filter(author__in=User.objects.filter(
+        follow_to__user=user, followers_count__gt=FEED_FANOUT_LIMIT
+    ))
+    if position:
+        published, pk = position
+        entries = entries.filter(
+            Q(published__lt=published)
+            | Q(published=published, recipe_id__lt=pk)
+        )
+        recipes = recipes.filter(
+            Q(published__lt=published) | Q(published=published, id__lt=pk)
+        )
+    entries = entries.order_by('-published', '-recipe_id').values_list(
+        'published', 'recipe_id'
+    )[:limit]
+    recipes = recipes.order_by('-published', '-id').values_list(
+        'published', 'id'
+    )[:limit]
+    seen = set()
+    page = []
+    for published, recipe_id in merge(entries, recipes, reverse=True):
+        if recipe_id not in seen:
+            seen.add(recipe_id)
+            page.append((published, recipe_id))
+    return page[:limit]
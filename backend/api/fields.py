@@ -0,0 +1,107 @@
+from base64 import b64decode
+from binascii import Error as DecodeError
+from hashlib import sha256
+from tempfile import TemporaryFile
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from recipes.constants import IMAGE_MAX_DIMENSION, IMAGE_MAX_SIZE
+from rest_framework.serializers import ValidationError
+
+DECODE_CHUNK_SIZE = 64 * 1024
+IMAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class ContentAddressedImageField(Base64ImageField):
+    """
+    Поле картинки в base64 с хранением файлов по хешу содержимого.
+    Размер файла проверяется по длине строки до декодирования,
+    строка декодируется порциями во временный файл, а размеры картинки
+    проверяются по заголовку до разбора пикселей.
+    Одинаковые картинки хранятся одним файлом, а повторно
+    присланная строка узнается по кэшу без декодирования.
+    """
+    TOO_LARGE_MESSAGE = (
+        f'Размер картинки не должен превышать {IMAGE_MAX_SIZE} байт.'
+    )
+    TOO_BIG_MESSAGE = (
+        'Ширина и высота картинки не должны превышать '
+        f'{IMAGE_MAX_DIMENSION} пикселей.'
+    )
+
+    def get_upload_to(self):
+        """ Каталог загрузки из поля модели сериализатора. """
+        model = self.parent.Meta.model
+        return model._meta.get_field(self.source).upload_to
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            return super().to_internal_value(base64_data)
+        payload = base64_data.rpartition(';base64,')[2]
+        if len(payload) // 4 * 3 > IMAGE_MAX_SIZE:
+            raise ValidationError(self.TOO_LARGE_MESSAGE)
+        payload_hash = sha256()
+        for start in range(0, len(payload), DECODE_CHUNK_SIZE):
+            payload_hash.update(
+                payload[start:start + DECODE_CHUNK_SIZE].encode()
+            )
+        key = f'image:{payload_hash.hexdigest()}'
+        name = cache.get(key)
+        if name is None or not default_storage.exists(name):
+            name = self.store(payload)
+            cache.set(key, name, IMAGE_CACHE_TIMEOUT)
+        return name
+
+    def decode(self, payload, file):
+        """
+        Декодирование base64 порциями в файл.
+        Возвращает sha256 декодированного содержимого.
+        """
+        digest = sha256()
+        rest = ''
+        try:
+            for start in range(0, len(payload), DECODE_CHUNK_SIZE):
+                chunk = rest + ''.join(
+                    payload[start:start + DECODE_CHUNK_SIZE].split()
+                )
+                size = len(chunk) // 4 * 4
+                chunk, rest = chunk[:size], chunk[size:]
+                data = b64decode(chunk, validate=True)
+                digest.update(data)
+                file.write(data)
+            if rest:
+                raise DecodeError
+        except (DecodeError, ValueError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        return digest.hexdigest()
+
+    def store(self, payload):
+        """
+        Сохранение картинки в хранилище под именем из хеша содержимого.
+        Если такой файл уже есть, повторно он не записывается.
+        """
+        with TemporaryFile() as file:
+            digest = self.decode(payload, file)
+            file.seek(0)
+            try:
+                image = Image.open(file)
+                if max(image.size) > IMAGE_MAX_DIMENSION:
+                    raise ValidationError(self.TOO_BIG_MESSAGE)
+                image.verify()
+            except (OSError, SyntaxError, Image.DecompressionBombError):
+                raise ValidationError(self.INVALID_FILE_MESSAGE)
+            extension = 'jpg' if image.format == 'JPEG' else (
+                (image.format or '').lower()
+            )
+            if extension not in self.ALLOWED_TYPES:
+                raise ValidationError(self.INVALID_TYPE_MESSAGE)
+            name = f'{self.get_upload_to()}{digest}.{extension}'
+            if default_storage.exists(name):
+                return name
+            file.seek(0)
+            return default_storage.save(name, File(file, name))
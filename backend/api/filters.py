@@ -1,8 +1,16 @@
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Lower, Replace
 from django_filters import (CharFilter, FilterSet, ModelChoiceFilter,
                             ModelMultipleChoiceFilter, NumberFilter)
+from recipes.constants import POPULAR_ORDERING, SEARCH_CONFIG
 from recipes.models import Ingredient, Recipe, Tag
 from users.models import User
 
+from api.search import normalize_name
+
 
 class RecipeFilter(FilterSet):
     """ Фильтрсет по фильтрации полей модели рецептов. """
@@ -18,6 +26,8 @@ class RecipeFilter(FilterSet):
         to_field_name='slug',
         lookup_expr='contains')
     author = ModelChoiceFilter(queryset=User.objects.all())
+    search = CharFilter(method='filter_search')
+    ordering = CharFilter(method='filter_ordering')
 
     class Meta:
         model = Recipe
@@ -37,14 +47,70 @@ class RecipeFilter(FilterSet):
             queryset = queryset.filter(shopping_carts__user=user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """
+        Функция полнотекстового поиска рецептов по названию,
+        описанию и ингредиентам. На PostgreSQL использует
+        поисковый вектор с GIN-индексом и сортирует по релевантности,
+        на других БД ищет вхождение в название и описание.
+        """
+        if connection.vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+
+    def filter_ordering(self, queryset, name, value):
+        """
+        Функция сортировки рецептов.
+        ordering=popular - по заранее посчитанной популярности.
+        """
+        if value == POPULAR_ORDERING:
+            queryset = queryset.order_by('-popularity', '-id')
+        return queryset
+
 
 class IngredientFilter(FilterSet):
-    """ Фильтрсет по фильтрации полей модели ингредиентов. """
+    """
+    Фильтрсет по фильтрации полей модели ингредиентов.
+    Поиск по названию идет без учета регистра и различия ё/е
+    (как в индексе ингредиентов в памяти) по индексу на выражении
+    replace(lower(name), 'ё', 'е').
+    На PostgreSQL при этом добавляются нечеткие совпадения pg_trgm,
+    которые выдаются после совпадений по началу названия.
+    """
     name = CharFilter(
         field_name='name',
-        lookup_expr='startswith'
+        method='filter_name'
     )
 
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+    def filter_name(self, queryset, name, value):
+        """ Функция поиска ингредиентов по началу названия. """
+        value = normalize_name(value)
+        queryset = queryset.annotate(
+            search_name=Replace(Lower('name'), Value('ё'), Value('е'))
+        )
+        prefix = Q(search_name__startswith=value)
+        if connection.vendor != 'postgresql':
+            return queryset.filter(prefix).order_by('search_name')
+        return queryset.annotate(
+            is_prefix=Case(
+                When(prefix, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            ),
+            similarity=TrigramSimilarity('search_name', value)
+        ).filter(
+            prefix
+            | Q(search_name__contains=value)
+            | Q(search_name__trigram_similar=value)
+        ).order_by('is_prefix', '-similarity', 'search_name')
@@ -0,0 +1,113 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from recipes.models import IngredientQuantity
+
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+FRAGMENT_GENERATION_KEY = 'recipe_fragment_generation'
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+def get_fragment_generation():
+    """
+    Функция получения поколения кэша представлений рецептов.
+    Поколение входит в ключ каждого фрагмента, поэтому его смена
+    разом делает устаревшими все закэшированные рецепты.
+    """
+    generation = cache.get(FRAGMENT_GENERATION_KEY)
+    if generation is None:
+        generation = time.time_ns()
+        cache.set(FRAGMENT_GENERATION_KEY, generation, None)
+    return generation
+
+
+async def aget_fragment_generation():
+    """ Асинхронный вариант get_fragment_generation. """
+    generation = await cache.aget(FRAGMENT_GENERATION_KEY)
+    if generation is None:
+        generation = await sync_to_async(get_fragment_generation)()
+    return generation
+
+
+def bump_fragment_generation():
+    """
+    Функция смены поколения кэша представлений рецептов.
+    Вызывается при изменении тегов, ингредиентов и авторов,
+    которые входят в представление многих рецептов сразу.
+    """
+    transaction.on_commit(lambda: cache.set(
+        FRAGMENT_GENERATION_KEY, time.time_ns(), None
+    ))
+
+
+def get_fragment_key(recipe, generation, prefix):
+    """
+    Ключ фрагмента: id и дата изменения рецепта, поколение кэша
+    и адрес сайта, от которого зависят абсолютные ссылки на картинки.
+    """
+    return (
+        f'recipe_fragment:{generation}:{prefix}:'
+        f'{recipe.pk}:{recipe.updated.timestamp()}'
+    )
+
+
+def prefetch_fragment_objects(recipes):
+    """ Подгрузка связанных объектов рецептов, которых нет в кэше. """
+    prefetch_related_objects(
+        recipes,
+        'tags',
+        'author',
+        Prefetch(
+            'recipe',
+            queryset=IngredientQuantity.objects.select_related('ingredient')
+        ),
+    )
+
+
+def get_fragments(recipes, build_fragment, prefix=''):
+    """
+    Функция получения не зависящих от пользователя частей
+    представлений рецептов. Фрагменты читаются из кэша одним
+    запросом, для отсутствующих связанные объекты подгружаются
+    пачкой, а построенные фрагменты записываются в кэш.
+    Возвращает список фрагментов в порядке рецептов.
+    """
+    generation = get_fragment_generation()
+    keys = [get_fragment_key(recipe, generation, prefix) for recipe in recipes]
+    fragments = cache.get_many(keys)
+    missing = [
+        (key, recipe) for key, recipe in zip(keys, recipes)
+        if key not in fragments
+    ]
+    if missing:
+        prefetch_fragment_objects([recipe for _, recipe in missing])
+        built = {key: build_fragment(recipe) for key, recipe in missing}
+        cache.set_many(built, FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(built)
+    return [fragments[key] for key in keys]
+
+
+async def aget_fragments(recipes, build_fragment, prefix=''):
+    """
+    Асинхронный вариант get_fragments. Кэш читается асинхронно,
+    связанные объекты отсутствующих рецептов подгружаются в потоке
+    для синхронного кода.
+    """
+    generation = await aget_fragment_generation()
+    keys = [get_fragment_key(recipe, generation, prefix) for recipe in recipes]
+    fragments = await cache.aget_many(keys)
+    missing = [
+        (key, recipe) for key, recipe in zip(keys, recipes)
+        if key not in fragments
+    ]
+    if missing:
+        await sync_to_async(prefetch_fragment_objects)(
+            [recipe for _, recipe in missing]
+        )
+        built = {key: build_fragment(recipe) for key, recipe in missing}
+        await cache.aset_many(built, FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(built)
+    return [fragments[key] for key in keys]
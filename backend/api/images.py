@@ -0,0 +1,166 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from threading import Lock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+from PIL import Image, ImageOps
+from recipes.constants import (IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_WIDTHS,
+                               IMAGE_VARIANTS_DIR, IMAGE_WORKERS)
+from recipes.models import Recipe
+
+THUMB_FORMAT = 'jpeg'
+SRCSET_FORMAT = 'webp'
+
+logger = logging.getLogger('api.images')
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    """
+    Пул потоков для генерации превью вне потока запроса.
+    Создается при первом обращении, чтобы не запускать потоки
+    в процессах, которым он не нужен (миграции, команды).
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=IMAGE_WORKERS, thread_name_prefix='image'
+            )
+    return _executor
+
+
+def has_variants(recipe):
+    """ Превью построены для текущей картинки рецепта. """
+    return bool(recipe.image) and (
+        recipe.image_variants.get('source') == recipe.image.name
+    )
+
+
+def get_variant_path(recipe_id, name, width, file_format):
+    """
+    Путь превью в хранилище. Каталог рецепта отделяет превью
+    разных рецептов с одинаковой картинкой, а имя картинки
+    (хеш содержимого) - превью старой картинки от новой.
+    """
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{IMAGE_VARIANTS_DIR}{recipe_id}/{stem}_{width}.{file_format}'
+
+
+def save_variant(image, path, width, file_format):
+    """ Сохранение уменьшенной до width копии картинки в хранилище. """
+    pil_format, options = IMAGE_VARIANT_FORMATS[file_format]
+    variant = image.copy()
+    variant.thumbnail((width, variant.height), Image.LANCZOS)
+    if pil_format == 'JPEG' and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    buffer = BytesIO()
+    variant.save(buffer, pil_format, **options)
+    if default_storage.exists(path):
+        default_storage.delete(path)
+    return default_storage.save(path, ContentFile(buffer.getvalue()))
+
+
+def get_variant_files(variants):
+    """ Пути всех файлов превью из словаря image_variants. """
+    return {
+        path
+        for width, formats in variants.items() if width != 'source'
+        for path in formats.values()
+    }
+
+
+def delete_variant_files(paths):
+    """ Удаление файлов превью из хранилища. """
+    for path in paths:
+        default_storage.delete(path)
+
+
+def generate_variants(recipe_id, name):
+    """
+    Построение уменьшенных копий картинки рецепта во всех
+    форматах и ширинах. Ширины больше исходной пропускаются.
+    Результат записывается, только если картинка рецепта
+    не сменилась за время обработки, иначе построенные файлы
+    удаляются. После записи удаляются файлы превью прежней картинки.
+    Дата изменения рецепта обновляется вместе с превью: от нее
+    зависят ETag и кэш представления рецепта.
+    """
+    with default_storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    variants = {'source': name}
+    for width in IMAGE_VARIANT_WIDTHS:
+        if width > image.width and width != IMAGE_VARIANT_WIDTHS[0]:
+            break
+        variants[str(width)] = {
+            file_format: save_variant(
+                image,
+                get_variant_path(recipe_id, name, width, file_format),
+                width,
+                file_format
+            )
+            for file_format in IMAGE_VARIANT_FORMATS
+        }
+    old_variants = Recipe.objects.filter(pk=recipe_id).values_list(
+        'image_variants', flat=True
+    ).first() or {}
+    new_files = get_variant_files(variants)
+    if Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants=variants, updated=timezone.now()
+    ):
+        delete_variant_files(get_variant_files(old_variants) - new_files)
+    else:
+        delete_variant_files(new_files)
+    return variants
+
+
+def run_variants_job(recipe_id, name):
+    """
+    Генерация превью в потоке пула. Соединение с БД у потока свое
+    и живет между задачами, поэтому устаревшее или сломанное
+    соединение закрывается до и после задачи, как после запроса.
+    """
+    close_old_connections()
+    try:
+        return generate_variants(recipe_id, name)
+    finally:
+        close_old_connections()
+
+
+def log_variants_error(recipe_id, future):
+    """ Ошибка задачи пула иначе осталась бы только в объекте Future. """
+    error = future.exception()
+    if error is not None:
+        logger.error(
+            'Не удалось построить превью рецепта %s', recipe_id,
+            exc_info=error
+        )
+
+
+def schedule_variants(recipe):
+    """ Постановка генерации превью рецепта в пул потоков. """
+    if recipe.image and not has_variants(recipe):
+        future = get_executor().submit(
+            run_variants_job, recipe.pk, recipe.image.name
+        )
+        future.add_done_callback(partial(log_variants_error, recipe.pk))
+
+
+def get_variant_urls(recipe, file_format):
+    """ Словарь ширина -> url превью рецепта в формате file_format. """
+    return {
+        int(width): default_storage.url(formats[file_format])
+        for width, formats in recipe.image_variants.items()
+        if width != 'source'
+    }
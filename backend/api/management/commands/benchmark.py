@@ -0,0 +1,255 @@
+import json
+import platform
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from statistics import mean, quantiles
+from threading import local
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from recipes.models import Ingredient, ShoppingCart
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+# (название, путь, нужна ли авторизация)
+SCENARIO = (
+    ('recipes', '/api/recipes/?page={page}', False),
+    ('recipes_authorized', '/api/recipes/?page={page}', True),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3', True),
+    ('ingredients_search', '/api/ingredients/?name={prefix}', False),
+    ('download_shopping_cart', '/api/recipes/download_shopping_cart/', True),
+)
+MAX_PAGE = 20
+PREFIX_LENGTH = 2
+SAMPLE_USERS = 20
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def get_percentiles(values):
+    """ p50, p95 и p99 в миллисекундах. """
+    if len(values) < 2:
+        value = round(values[0] * 1000, 2) if values else None
+        return value, value, value
+    cuts = quantiles(values, n=100, method='inclusive')
+    return tuple(round(cuts[index] * 1000, 2) for index in (49, 94, 98))
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный сценарий по основным эндпоинтам API с отчетом '
+        'о задержках, пропускной способности и количестве запросов к БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера. Без него запросы выполняются '
+                 'в процессе через тестовый клиент Django'
+        )
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Запросов на каждый эндпоинт сценария')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Неучитываемых запросов на эндпоинт')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Параллельных клиентов (только с --url)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark.json',
+                            help='Файл для записи результатов')
+        parser.add_argument('--compare',
+                            help='Файл с результатами прошлого запуска')
+        parser.add_argument(
+            '--max-regression', type=float,
+            help='Допустимый рост p95 в процентах относительно --compare'
+        )
+
+    def get_tokens(self, rng):
+        """ Токены пользователей с подписками и списком покупок. """
+        users = list(User.objects.filter(
+            follower__isnull=False,
+            id__in=ShoppingCart.objects.values('user_id')
+        ).distinct().values_list('id', flat=True)[:SAMPLE_USERS * 10])
+        if not users:
+            raise CommandError(
+                'Нет пользователей с подписками и списком покупок, '
+                'сначала выполните generate_data'
+            )
+        return [
+            Token.objects.get_or_create(user_id=user_id)[0].key
+            for user_id in rng.sample(users, min(SAMPLE_USERS, len(users)))
+        ]
+
+    def get_plan(self, rng, count):
+        """ Перемешанный список запросов сценария. """
+        names = list(Ingredient.objects.values_list(
+            'name', flat=True
+        )[:1000]) or ['а']
+        plan = []
+        for name, path, auth in SCENARIO:
+            for _ in range(count):
+                plan.append((name, path.format(
+                    page=rng.randint(1, MAX_PAGE),
+                    prefix=rng.choice(names)[:PREFIX_LENGTH],
+                ), rng.choice(self.tokens) if auth else None))
+        rng.shuffle(plan)
+        return plan
+
+    def request_local(self, path, token):
+        """
+        Запрос через тестовый клиент с подсчетом запросов к БД.
+        Журнал запросов соединения ограничен 9000 записями и после
+        заполнения перестает расти, поэтому перед каждым запросом
+        он очищается.
+        """
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        reset_queries()
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return (
+            time.perf_counter() - start,
+            len(queries.captured_queries),
+            response.status_code
+        )
+
+    def request_http(self, path, token):
+        """
+        HTTP-запрос к серверу. Количество запросов к БД берется
+        из заголовка Server-Timing, если на сервере включено
+        QUERY_INSTRUMENTATION.
+        """
+        session = getattr(self.sessions, 'session', None)
+        if session is None:
+            session = self.sessions.session = requests.Session()
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        start = time.perf_counter()
+        response = session.get(self.url + path, headers=headers)
+        elapsed = time.perf_counter() - start
+        match = SERVER_TIMING_QUERIES.search(
+            response.headers.get('Server-Timing', '')
+        )
+        return (
+            elapsed,
+            int(match.group(1)) if match else None,
+            response.status_code
+        )
+
+    def run_plan(self, plan, request, concurrency):
+        results = {name: [] for name, _, _ in SCENARIO}
+
+        def run(item):
+            name, path, token = item
+            results[name].append(request(path, token))
+
+        start = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(run, plan))
+        else:
+            for item in plan:
+                run(item)
+        return results, time.perf_counter() - start
+
+    def build_report(self, results, elapsed, concurrency, kwargs):
+        endpoints = {}
+        for name, _, _ in SCENARIO:
+            samples = results[name]
+            durations = [duration for duration, _, _ in samples]
+            queries = [count for _, count, _ in samples if count is not None]
+            p50, p95, p99 = get_percentiles(durations)
+            endpoints[name] = {
+                'requests': len(samples),
+                'errors': sum(status >= 400 for _, _, status in samples),
+                'mean_ms': round(mean(durations) * 1000, 2)
+                if durations else None,
+                'p50_ms': p50,
+                'p95_ms': p95,
+                'p99_ms': p99,
+                'rps': round(len(samples) / elapsed, 2),
+                'queries_per_request': round(mean(queries), 2)
+                if queries else None,
+            }
+        total = sum(len(samples) for samples in results.values())
+        return {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'mode': 'http' if kwargs['url'] else 'local',
+            'url': kwargs['url'],
+            'concurrency': concurrency,
+            'seed': kwargs['seed'],
+            'elapsed_s': round(elapsed, 3),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2),
+            'endpoints': endpoints,
+        }
+
+    def compare(self, report, baseline_path, max_regression):
+        """ Сравнение p95 с прошлым запуском. """
+        with open(baseline_path, encoding='utf8') as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, stats in report['endpoints'].items():
+            old = baseline['endpoints'].get(name, {}).get('p95_ms')
+            if not old or stats['p95_ms'] is None:
+                continue
+            change = (stats['p95_ms'] - old) / old * 100
+            self.stdout.write(
+                f'{name:25} p95 {old:>9.2f} -> {stats["p95_ms"]:>9.2f} ms '
+                f'({change:+.1f}%)'
+            )
+            if max_regression is not None and change > max_regression:
+                regressions.append(name)
+        return regressions
+
+    def handle(self, *args, **kwargs):
+        rng = random.Random(kwargs['seed'])
+        self.tokens = self.get_tokens(rng)
+        concurrency = 1
+        if kwargs['url']:
+            self.url = kwargs['url'].rstrip('/')
+            self.sessions = local()
+            request = self.request_http
+            concurrency = kwargs['concurrency']
+        else:
+            setup_test_environment()
+            self.client = Client()
+            request = self.request_local
+        self.run_plan(
+            self.get_plan(rng, kwargs['warmup']), request, concurrency
+        )
+        results, elapsed = self.run_plan(
+            self.get_plan(rng, kwargs['requests']), request, concurrency
+        )
+        report = self.build_report(results, elapsed, concurrency, kwargs)
+        with open(kwargs['output'], 'w', encoding='utf8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        for name, stats in report['endpoints'].items():
+            self.stdout.write(
+                f'{name:25} p50 {stats["p50_ms"]} p95 {stats["p95_ms"]} '
+                f'p99 {stats["p99_ms"]} ms, '
+                f'запросов к БД {stats["queries_per_request"]}, '
+                f'ошибок {stats["errors"]}'
+            )
+        self.stdout.write(
+            f'Всего {report["requests"]} запросов, '
+            f'{report["throughput_rps"]} rps'
+        )
+        if kwargs['compare']:
+            regressions = self.compare(
+                report, kwargs['compare'], kwargs['max_regression']
+            )
+            if regressions:
+                raise CommandError(
+                    'Рост p95 выше допустимого: ' + ', '.join(regressions)
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {kwargs["output"]}'
+        ))
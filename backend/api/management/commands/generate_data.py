@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from api.factories import BATCH_SIZE, generate_data
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетические данные для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2, default=(3, 12),
+            metavar=('MIN', 'MAX'),
+            help='Диапазон количества ингредиентов в рецепте'
+        )
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Рецептов в избранном у пользователя')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Рецептов в списке покупок у пользователя')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок у пользователя')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **kwargs):
+        data = generate_data(
+            users=kwargs['users'],
+            recipes=kwargs['recipes'],
+            ingredients=kwargs['ingredients'],
+            tags=kwargs['tags'],
+            ingredients_per_recipe=kwargs['ingredients_per_recipe'],
+            favorites_per_user=kwargs['favorites'],
+            carts_per_user=kwargs['carts'],
+            subscriptions_per_user=kwargs['subscriptions'],
+            seed=kwargs['seed'],
+            batch_size=kwargs['batch_size'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Данные сгенерированы: ' + ', '.join(
+                f'{name} - {len(ids)}' for name, ids in data.items()
+            )
+        ))
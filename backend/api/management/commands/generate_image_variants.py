@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from recipes.constants import IMAGE_WORKERS
+from recipes.models import Recipe
+
+from api.images import has_variants, run_variants_job
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Строит превью картинок рецептов, для которых их еще нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить превью всех рецептов'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=IMAGE_WORKERS,
+            help='Количество потоков обработки картинок'
+        )
+
+    def handle(self, *args, **kwargs):
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_variants'
+        ).order_by('id')
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=kwargs['workers']) as executor:
+            futures = {
+                executor.submit(
+                    run_variants_job, recipe.pk, recipe.image.name
+                ): recipe.pk
+                for recipe in recipes.iterator(chunk_size=BATCH_SIZE)
+                if kwargs['force'] or not has_variants(recipe)
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as error:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(
+                        f'Рецепт {futures[future]}: {error}'
+                    ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Превью построены для {done} рецептов, ошибок: {failed}'
+        ))
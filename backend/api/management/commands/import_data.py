@@ -1,81 +1,281 @@
 import csv
+import os
+from itertools import islice
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
 from recipes.models import Ingredient, IngredientQuantity, Recipe, Tag
 from users.models import User
 
+from api.fragments import bump_fragment_generation
+from api.search import update_search_vectors
+from api.utils import bump_shopping_list_generation
+
+DATA_DIR = 'data'
+BATCH_SIZE = 1000
+
+
+class SkipBlankLines:
+    """
+    Файлоподобная обертка для COPY FROM STDIN.
+    Пропускает пустые строки, которые csv.DictReader игнорирует,
+    а COPY считает ошибкой.
+    """
+    def __init__(self, file, lines_per_read=BATCH_SIZE):
+        self.lines = (line for line in file if line.strip())
+        self.lines_per_read = lines_per_read
+
+    def read(self, size=-1):
+        return ''.join(islice(self.lines, self.lines_per_read))
+
 
 class Command(BaseCommand):
     help = 'Импортирует данные из csv в БД'
 
-    def import_users(self):
-        with open('data/users.csv', encoding="utf8") as users:
-            reader = csv.DictReader(users)
-            for row in reader:
-                User.objects.create(
-                    password=row['password'],
-                    is_superuser=row['is_superuser'],
-                    username=row['username'],
-                    email=row['email'],
-                    first_name=row['first_name'],
-                    last_name=row['last_name'],
-                    is_active=row['is_active'],
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество строк, записываемых в БД одним запросом'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Пропускать строки, id которых уже есть в БД'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY на PostgreSQL, загружать через ORM'
+        )
+
+    def read_csv(self, file_name):
+        """ Генератор строк csv-файла без загрузки файла в память. """
+        with open(os.path.join(DATA_DIR, file_name), encoding='utf8') as file:
+            yield from csv.DictReader(file)
+
+    def read_batches(self, file_name):
+        """ Генератор пачек строк csv-файла размером batch_size. """
+        rows = self.read_csv(file_name)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def get_ids(self, model):
+        """ Множество id уже существующих в БД объектов модели. """
+        return set(model.objects.values_list('id', flat=True))
+
+    def reset_sequences(self, *models):
+        """
+        Сброс счетчиков id после вставки объектов с явными id,
+        чтобы последующие записи не конфликтовали с загруженными.
+        """
+        sql_list = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in sql_list:
+                cursor.execute(sql)
+
+    def copy_import(self, model, file_name, insert_sql):
+        """
+        Загрузка csv-файла через COPY FROM STDIN (только PostgreSQL).
+        Файл целиком копируется во временную staging-таблицу
+        с текстовыми колонками по заголовку csv, после чего
+        insert_sql переносит строки в таблицу модели с обновлением
+        уже существующих записей.
+        """
+        path = os.path.join(DATA_DIR, file_name)
+        with open(path, encoding='utf8') as file:
+            header = next(csv.reader(file))
+        staging = f'{model._meta.db_table}_staging'
+        columns = [f'"{column}"' for column in header]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE {staging} '
+                f'({", ".join(f"{column} text" for column in columns)}) '
+                'ON COMMIT DROP'
+            )
+            with open(path, encoding='utf8') as file:
+                cursor.copy_expert(
+                    f'COPY {staging} ({", ".join(columns)}) '
+                    'FROM STDIN WITH (FORMAT csv, HEADER true)',
+                    SkipBlankLines(file, self.batch_size)
                 )
+            cursor.execute(f'SELECT count(*) FROM {staging}')
+            total = cursor.fetchone()[0]
+            cursor.execute(insert_sql.format(
+                table=model._meta.db_table, staging=staging
+            ))
+            loaded = cursor.rowcount
+            self.reset_sequences(model)
+        self.stdout.write(
+            f'{file_name}: загружено {loaded}, пропущено {total - loaded}'
+        )
 
-    def import_ingredients(self):
-        with open('data/ingredients.csv', encoding="utf8") as ingredients:
-            reader = csv.DictReader(ingredients)
-            for row in reader:
-                Ingredient.objects.create(
-                    id=row['id'],
-                    name=row['name'],
-                    measurement_unit=row['measurement_unit'],
+    def bulk_import(self, model, file_name, build_object, on_batch=None):
+        """
+        Общий метод загрузки csv-файла в модель.
+        Весь файл загружается в одной транзакции пачками через bulk_create.
+        build_object возвращает объект модели или None для пропуска строки,
+        on_batch вызывается для каждой записанной пачки объектов.
+        """
+        existing_ids = self.get_ids(model) if self.resume else set()
+        created = skipped = 0
+        with transaction.atomic():
+            for batch in self.read_batches(file_name):
+                objects = []
+                for row in batch:
+                    obj = None
+                    if int(row['id']) not in existing_ids:
+                        obj = build_object(row)
+                    if obj is None:
+                        skipped += 1
+                        continue
+                    objects.append(obj)
+                model.objects.bulk_create(objects, batch_size=self.batch_size)
+                if on_batch:
+                    on_batch(objects, batch)
+                created += len(objects)
+                self.stdout.write(
+                    f'{file_name}: загружено {created}, пропущено {skipped}'
                 )
+            self.reset_sequences(model)
+
+    def import_users(self):
+        self.bulk_import(User, 'users.csv', lambda row: User(
+            id=row['id'],
+            password=row['password'],
+            is_superuser=row['is_superuser'] == '1',
+            username=row['username'],
+            email=row['email'],
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+            is_active=row['is_active'] == '1',
+        ))
+
+    def import_ingredients(self):
+        if self.use_copy:
+            self.copy_import(Ingredient, 'ingredients.csv', '''
+                INSERT INTO {table} (id, name, measurement_unit, updated)
+                SELECT id::bigint, name, measurement_unit, now()
+                FROM {staging}
+                ON CONFLICT (id) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    measurement_unit = EXCLUDED.measurement_unit,
+                    updated = EXCLUDED.updated
+                WHERE ({table}.name, {table}.measurement_unit)
+                    IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.measurement_unit)
+            ''')
+            return
+        self.bulk_import(Ingredient, 'ingredients.csv', lambda row: Ingredient(
+            id=row['id'],
+            name=row['name'],
+            measurement_unit=row['measurement_unit'],
+        ))
 
     def import_tags(self):
-        with open('data/tags.csv', encoding='utf8') as tags:
-            reader = csv.DictReader(tags)
-            for row in reader:
-                Tag.objects.create(
-                    name=row['name'],
-                    color=row['color'],
-                    slug=row['slug'],
-                )
+        self.bulk_import(Tag, 'tags.csv', lambda row: Tag(
+            id=row['id'],
+            name=row['name'],
+            color=row['color'],
+            slug=row['slug'],
+        ))
 
     def import_recipe(self):
-        with open('data/recipes.csv', encoding='utf8') as recipes:
-            reader = csv.DictReader(recipes)
-            for row in reader:
-                recipe = Recipe.objects.create(
-                    author=User.objects.get(id=row['author']),
-                    name=row['name'],
-                    image=row['image'],
-                    text=row['text'],
-                    cooking_time=row['cooking_time'],
-                )
+        user_ids = self.get_ids(User)
+        tag_ids = self.get_ids(Tag)
+        recipe_tags = Recipe.tags.through
+
+        def build_recipe(row):
+            author_id = int(row['author'])
+            if author_id not in user_ids:
+                return None
+            return Recipe(
+                id=row['id'],
+                author_id=author_id,
+                name=row['name'],
+                image=row['image'],
+                text=row['text'],
+                cooking_time=row['cooking_time'],
+            )
 
-                tags = [int(tag) for tag in row['tags'].split(',')]
-                recipe.tags.set(tags)
+        def set_tags(recipes, rows):
+            rows_by_id = {int(row['id']): row for row in rows}
+            recipe_tags.objects.bulk_create(
+                [
+                    recipe_tags(recipe_id=recipe.id, tag_id=tag_id)
+                    for recipe in recipes
+                    for tag_id in map(
+                        int, rows_by_id[int(recipe.id)]['tags'].split(',')
+                    )
+                    if tag_id in tag_ids
+                ],
+                batch_size=self.batch_size,
+                ignore_conflicts=True
+            )
+
+        self.bulk_import(Recipe, 'recipes.csv', build_recipe, set_tags)
 
     def import_amounts(self):
-        with open('data/quantities.csv', encoding='utf8') as quantities:
-            reader = csv.DictReader(quantities)
-            for row in reader:
-                IngredientQuantity.objects.update_or_create(
-                    amount=row['amount'],
-                    recipe=Recipe.objects.get(id=row['recipe']),
-                    ingredient=Ingredient.objects.get(id=row['ingredient'])
-                )
+        if self.use_copy:
+            self.copy_import(IngredientQuantity, 'quantities.csv', f'''
+                INSERT INTO {{table}} (id, recipe_id, ingredient_id, amount)
+                SELECT staging.id::bigint, recipe.id, ingredient.id,
+                    trim(staging.amount)::smallint
+                FROM {{staging}} AS staging
+                JOIN {Recipe._meta.db_table} AS recipe
+                    ON recipe.id = staging.recipe::bigint
+                JOIN {Ingredient._meta.db_table} AS ingredient
+                    ON ingredient.id = staging.ingredient::bigint
+                ON CONFLICT (id) DO UPDATE SET
+                    recipe_id = EXCLUDED.recipe_id,
+                    ingredient_id = EXCLUDED.ingredient_id,
+                    amount = EXCLUDED.amount
+            ''')
+            return
+        recipe_ids = self.get_ids(Recipe)
+        ingredient_ids = self.get_ids(Ingredient)
+
+        def build_amount(row):
+            recipe_id = int(row['recipe'])
+            ingredient_id = int(row['ingredient'])
+            if (recipe_id not in recipe_ids
+                    or ingredient_id not in ingredient_ids):
+                return None
+            return IngredientQuantity(
+                id=row['id'],
+                amount=int(row['amount']),
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+            )
+
+        self.bulk_import(IngredientQuantity, 'quantities.csv', build_amount)
 
     def handle(self, *args, **kwargs):
+        self.batch_size = kwargs['batch_size']
+        self.resume = kwargs['resume']
+        self.use_copy = (
+            connection.vendor == 'postgresql' and not kwargs['no_copy']
+        )
         try:
             self.import_users()
             self.import_ingredients()
             self.import_tags()
             self.import_recipe()
             self.import_amounts()
+            update_search_vectors(Recipe.objects.all())
+            call_command('recount', stdout=self.stdout)
+            # Загрузка меняет названия ингредиентов и количества в обход
+            # сигналов, поэтому кэш фрагментов и списков покупок сбрасывается.
+            bump_fragment_generation()
+            bump_shopping_list_generation()
         except Exception as error:
-            self.stdout.write(self.style.ERROR(error))
+            self.stdout.write(self.style.ERROR(str(error)))
+            return
         self.stdout.write(self.style.SUCCESS(
             'Данные из CSV файлов успешно загружены!'
         )
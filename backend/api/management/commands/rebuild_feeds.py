@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from recipes.constants import FEED_BACKFILL_SIZE
+from recipes.models import FeedEntry
+from users.models import UserSubscription
+
+from api.feed import backfill_feed
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Заполняет ленты подписок последними рецептами авторов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=FEED_BACKFILL_SIZE,
+            help='Количество последних рецептов каждого автора в ленте'
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Очистить ленты перед заполнением'
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['clear']:
+            FeedEntry.objects.all().delete()
+        subscriptions = UserSubscription.objects.values_list(
+            'user_id', 'follow_to_id'
+        ).order_by('id')
+        for user_id, author_id in subscriptions.iterator(
+            chunk_size=BATCH_SIZE
+        ):
+            backfill_feed(user_id, author_id, kwargs['size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты заполнены, записей: {FeedEntry.objects.count()}'
+        ))
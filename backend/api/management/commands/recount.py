@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import FavoriteRecipes, Recipe, ShoppingCart
+from users.models import User, UserSubscription
+
+COUNTERS = (
+    (Recipe, 'favorites_count', FavoriteRecipes, 'recipe'),
+    (Recipe, 'shopping_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', UserSubscription, 'follow_to'),
+    (User, 'following_count', UserSubscription, 'user'),
+)
+
+
+def count_related(related_model, fk_field):
+    """ Подзапрос количества связанных объектов для OuterRef('pk'). """
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{fk_field: OuterRef('pk')}
+        ).order_by().values(fk_field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики рецептов и пользователей'
+
+    def handle(self, *args, **kwargs):
+        for model, field, related_model, fk_field in COUNTERS:
+            fixed = model.objects.annotate(
+                actual=count_related(related_model, fk_field)
+            ).exclude(
+                **{field: F('actual')}
+            ).update(**{field: count_related(related_model, fk_field)})
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: исправлено {fixed}'
+            )
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны!'))
@@ -0,0 +1,51 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import FavoriteRecipes, Recipe, ShoppingCart
+
+from api.popularity import get_contribution
+
+BATCH_SIZE = 1000
+TOLERANCE = 1e-9
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает популярность рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество рецептов, обновляемых одним запросом'
+        )
+
+    def collect_scores(self):
+        """ Сумма вкладов избранного и списков покупок по рецептам. """
+        scores = defaultdict(float)
+        for kind, model in (
+            ('favorite', FavoriteRecipes), ('shopping_cart', ShoppingCart)
+        ):
+            rows = model.objects.values_list('recipe_id', 'created')
+            for recipe_id, created in rows.iterator(chunk_size=BATCH_SIZE):
+                scores[recipe_id] += get_contribution(kind, created)
+        return scores
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        scores = self.collect_scores()
+        changed = []
+        recipes = Recipe.objects.only('id', 'popularity').order_by()
+        for recipe in recipes.iterator(chunk_size=batch_size):
+            score = scores.get(recipe.id, 0.0)
+            if abs(recipe.popularity - score) > TOLERANCE * max(score, 1):
+                recipe.popularity = score
+                changed.append(recipe)
+        with transaction.atomic():
+            Recipe.objects.bulk_update(
+                changed, ['popularity'], batch_size=batch_size
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярность пересчитана, обновлено рецептов: {len(changed)}'
+        ))
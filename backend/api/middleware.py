@@ -0,0 +1,282 @@
+import json
+import logging
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+logger = logging.getLogger('api.instrumentation')
+
+QUERY_REPEAT_THRESHOLD = 5
+SLOWEST_QUERIES = 3
+SQL_PREVIEW_LENGTH = 200
+IN_LIST_PATTERN = re.compile(r'IN \((?:%s, )*%s\)')
+
+current_stats = ContextVar('current_stats', default=None)
+
+
+def get_query_shape(sql):
+    """ Вид запроса без учета длины списков IN (...). """
+    return IN_LIST_PATTERN.sub('IN (...)', sql)
+
+
+def execute_with_stats(execute, sql, params, many, context):
+    """
+    Обертка выполнения SQL, передающая запросы статистике текущего
+    запроса. Статистика берется из контекстной переменной, которая
+    копируется в потоки sync_to_async, поэтому учитываются и запросы
+    асинхронного ORM, выполняемые через соединения этих потоков.
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_execute_wrapper(connection, **kwargs):
+    """ Подключение execute_with_stats к соединению с БД. """
+    if execute_with_stats not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_with_stats)
+
+
+def get_serializer_field():
+    """
+    Поле сериализатора, при обработке которого выполняется запрос.
+    Ищется ближайший по стеку кадр to_representation сериализатора
+    DRF с локальной переменной field.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        local = frame.f_locals
+        if (frame.f_code.co_name == 'to_representation'
+                and isinstance(local.get('self'), serializers.Serializer)
+                and 'field' in local):
+            return (
+                f'{type(local["self"]).__name__}.'
+                f'{local["field"].field_name}'
+            )
+        frame = frame.f_back
+    return None
+
+
+@contextmanager
+def measure_serialization():
+    """
+    Учет времени сериализации в статистике текущего запроса.
+    Учитывается только внешний вызов, вложенные сериализаторы
+    входят в его время.
+    """
+    stats = current_stats.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += time.perf_counter() - start
+        stats.serializing = False
+
+
+def measure_serializer(data_property):
+    """ Обертка свойства data сериализаторов для учета времени. """
+    @wraps(data_property.fget)
+    def data(self):
+        with measure_serialization():
+            return data_property.fget(self)
+    return property(data)
+
+
+class RequestStats:
+    """ Статистика запросов к БД и сериализации одного запроса. """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view = None
+        self.queries = []
+        self.shapes = Counter()
+        self.origins = defaultdict(Counter)
+        self.serializer_time = 0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            shape = get_query_shape(sql)
+            self.queries.append((duration, sql))
+            self.shapes[shape] += 1
+            field = get_serializer_field()
+            if field:
+                self.origins[shape][field] += 1
+
+    def get_repeated(self, threshold):
+        """ Повторяющиеся запросы одного вида - признак N+1. """
+        return [
+            {
+                'sql': shape[:SQL_PREVIEW_LENGTH],
+                'count': count,
+                'field': (
+                    self.origins[shape].most_common(1)[0][0]
+                    if self.origins[shape] else None
+                ),
+            }
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+    def get_server_timing(self):
+        """ Значение заголовка Server-Timing в миллисекундах. """
+        sql_time = sum(duration for duration, _ in self.queries)
+        total = time.perf_counter() - self.start
+        return ', '.join((
+            f'db;dur={sql_time * 1000:.1f};desc="{len(self.queries)} queries"',
+            f'serializer;dur={self.serializer_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+    def get_record(self, request, response, threshold):
+        """ Структурированная запись для лога. """
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': self.view,
+            'status': response.status_code,
+            'queries': len(self.queries),
+            'sql_ms': round(
+                sum(duration for duration, _ in self.queries) * 1000, 1
+            ),
+            'serializer_ms': round(self.serializer_time * 1000, 1),
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 1),
+            'slowest': [
+                {'ms': round(duration * 1000, 1),
+                 'sql': sql[:SQL_PREVIEW_LENGTH]}
+                for duration, sql in sorted(
+                    self.queries, key=lambda query: query[0], reverse=True
+                )[:SLOWEST_QUERIES]
+            ],
+            'repeated': self.get_repeated(threshold),
+        }
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Middleware учета запросов к БД по представлениям.
+    Считает количество и суммарное время SQL-запросов, самые медленные
+    запросы и время сериализации, отдает их в заголовке Server-Timing
+    и пишет в лог api.instrumentation одной JSON-записью на запрос.
+    Запросы одного вида, повторенные QUERY_REPEAT_THRESHOLD и более раз,
+    помечаются как N+1 с указанием поля сериализатора, из которого
+    они выполнялись. Включается переменной окружения
+    QUERY_INSTRUMENTATION.
+    Под ASGI работает асинхронно и не переводит запросы к асинхронным
+    представлениям в поток. Соединения с БД у каждого потока свои,
+    поэтому счетчик подключается ко всем соединениям при их открытии,
+    а запрос, к которому относится SQL, определяется по контексту.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(install_execute_wrapper)
+        for connection in connections.all(initialized_only=True):
+            install_execute_wrapper(connection)
+        self.threshold = getattr(
+            settings, 'QUERY_REPEAT_THRESHOLD', QUERY_REPEAT_THRESHOLD
+        )
+        for serializer_class in (
+            serializers.Serializer, serializers.ListSerializer
+        ):
+            if not hasattr(serializer_class.data.fget, '__wrapped__'):
+                serializer_class.data = measure_serializer(
+                    serializer_class.data
+                )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(stats, request, response)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(stats, request, response)
+
+    def finish(self, stats, request, response):
+        """ Заголовок Server-Timing и запись в лог после ответа. """
+        response['Server-Timing'] = stats.get_server_timing()
+        if not response.streaming:
+            self.log(stats, request, response)
+        elif response.is_async:
+            response.streaming_content = self.awrap_streaming(
+                response.streaming_content, stats, request, response
+            )
+        else:
+            response.streaming_content = self.wrap_streaming(
+                response.streaming_content, stats, request, response
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = current_stats.get()
+        if stats is None:
+            return None
+        view_class = getattr(view_func, 'cls', None) or getattr(
+            view_func, 'view_class', None
+        )
+        name = view_class.__name__ if view_class else view_func.__name__
+        action = getattr(view_func, 'actions', {}).get(request.method.lower())
+        stats.view = f'{name}.{action}' if action else name
+        return None
+
+    def wrap_streaming(self, content, stats, request, response):
+        """
+        Учет запросов, выполняемых при отдаче потокового ответа.
+        Заголовки к этому моменту уже отправлены, поэтому полная
+        статистика попадает только в лог.
+        """
+        token = current_stats.set(stats)
+        try:
+            yield from content
+        finally:
+            current_stats.reset(token)
+        self.log(stats, request, response)
+
+    async def awrap_streaming(self, content, stats, request, response):
+        """ Асинхронный вариант wrap_streaming. """
+        token = current_stats.set(stats)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            current_stats.reset(token)
+        self.log(stats, request, response)
+
+    def log(self, stats, request, response):
+        record = stats.get_record(request, response, self.threshold)
+        level = logging.WARNING if record['repeated'] else logging.INFO
+        logger.log(level, json.dumps(record, ensure_ascii=False))
@@ -1,7 +1,15 @@
+from hashlib import md5
+
+from django.db.models import Count, Max
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers, quote_etag)
+from recipes.models import ShoppingCart
 from rest_framework.response import Response
 from rest_framework.status import (HTTP_201_CREATED, HTTP_204_NO_CONTENT,
                                    HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND)
 
+from api.utils import bump_shopping_list_version
+
 
 class GetCreateIsExistsObject:
     """
@@ -31,7 +39,12 @@ class GetCreateIsExistsObject:
         )
         if not created:
             return Response(status=HTTP_400_BAD_REQUEST)
-        serializer = serializers(obj)
+        if model is ShoppingCart:
+            bump_shopping_list_version(request.user.pk)
+        serializer = serializers(
+            obj,
+            context={'request': request}
+        )
         return Response(serializer.data, status=HTTP_201_CREATED)
 
     def delete_object(self, request, pk, model, obj_model, arg):
@@ -52,4 +65,66 @@ class GetCreateIsExistsObject:
                 return Response(status=HTTP_400_BAD_REQUEST)
             else:
                 instance.delete()
+                if model is ShoppingCart:
+                    bump_shopping_list_version(request.user.pk)
                 return Response(status=HTTP_204_NO_CONTENT)
+
+
+class ConditionalGetMixin:
+    """
+    Миксин условного GET (ETag, 304 Not Modified).
+    ETag считается по дешевому признаку версии данных, поэтому
+    при совпадении с If-None-Match ответ не сериализуется вовсе.
+    Last-Modified не отдается: по дате изменения нельзя заметить
+    удаление объекта или смену признаков пользователя.
+    """
+    cache_control = {'public': True, 'max_age': 60}
+
+    def get_model_version(self, queryset):
+        """
+        Версия набора данных: количество объектов и дата
+        последнего изменения (количество учитывает удаления).
+        """
+        return self.format_model_version(
+            queryset.aggregate(count=Count('id'), updated=Max('updated'))
+        )
+
+    async def aget_model_version(self, queryset):
+        """ Асинхронный вариант get_model_version. """
+        return self.format_model_version(await queryset.aaggregate(
+            count=Count('id'), updated=Max('updated')
+        ))
+
+    def format_model_version(self, version):
+        updated = version['updated']
+        return f'{version["count"]}-{updated.timestamp() if updated else 0}'
+
+    def get_etag(self, version):
+        return quote_etag(md5(version.encode()).hexdigest())
+
+    def patch_conditional_headers(self, response, etag):
+        """ Заголовки кэширования для ответов 200 и 304. """
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            patch_cache_control(response, **self.cache_control)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def conditional_response(self, request, version, get_response):
+        """
+        Ответ 304, если у клиента актуальная версия,
+        иначе результат get_response с заголовками кэширования.
+        """
+        etag = self.get_etag(version)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = get_response()
+        return self.patch_conditional_headers(response, etag)
+
+    async def aconditional_response(self, request, version, get_response):
+        """ Асинхронный вариант conditional_response. """
+        etag = self.get_etag(version)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = await get_response()
+        return self.patch_conditional_headers(response, etag)
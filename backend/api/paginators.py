@@ -1,4 +1,54 @@
+from base64 import b64decode, b64encode
+from binascii import Error as DecodeError
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from recipes.constants import POPULAR_ORDERING
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.feed import get_feed_entries
+
+APPROXIMATE_COUNT_THRESHOLD = 100_000
+
+
+def get_approximate_count(queryset):
+    """
+    Оценка количества строк таблицы по статистике PostgreSQL.
+    Применима только к кверисету без фильтров и только для больших
+    таблиц, иначе возвращается None и считается точное количество.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < APPROXIMATE_COUNT_THRESHOLD:
+        return None
+    return row[0]
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Пагинатор, берущий количество объектов большой таблицы
+    из статистики PostgreSQL вместо COUNT(*).
+    """
+    @cached_property
+    def count(self):
+        count = get_approximate_count(self.object_list)
+        if count is None:
+            return super().count
+        return count
 
 
 class StandardPagination(PageNumberPagination):
@@ -7,28 +57,141 @@ class StandardPagination(PageNumberPagination):
     page_size_query_param = 'limit'
 
 
-class SubPagination(PageNumberPagination):
+class RecipePagination(StandardPagination):
     """
-    Кастомный пагинатор с переопределением поля queryparam.
-    Проводится проверка queryparams в запросе на recipes_limit
-    с переопределением конечного кверисета.
-    Реализован под сущность подписок пользователя.
+    Пагинатор ленты рецептов.
+    По умолчанию работает постранично, как StandardPagination.
+    При наличии queryparam cursor (первая страница - пустой cursor)
+    работает по ключу (published, id) без OFFSET и COUNT(*):
+    каждая страница - это поиск по составному индексу.
+    При ordering=popular ключом служит (popularity, id).
     """
-    page_size_query_param = 'limit'
+    django_paginator_class = ApproximateCountPaginator
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    cursor_fields = {
+        None: ('published', datetime.fromisoformat, datetime.isoformat),
+        POPULAR_ORDERING: ('popularity', float, repr),
+    }
+    invalid_cursor_message = 'Неверный курсор.'
 
-    def get_page_size(self, request):
-        recipes_limit = None
-        if 'limit' in request.query_params:
-            limit = int(request.query_params['limit'])
-            return limit
-        if 'recipes_limit' in request.query_params:
-            recipes_limit = int(request.query_params['recipes_limit'])
-            return recipes_limit
-        return self.page_size
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.field, self.parse, self.format = self.cursor_fields.get(
+            request.query_params.get(self.ordering_query_param),
+            self.cursor_fields[None]
+        )
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        reverse = False
+        queryset = queryset.order_by(f'-{self.field}', '-id')
+        if position:
+            reverse, value, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(**{f'{self.field}__gt': value})
+                    | Q(**{self.field: value, 'id__gt': pk})
+                ).order_by(self.field, 'id')
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{self.field}__lt': value})
+                    | Q(**{self.field: value, 'id__lt': pk})
+                )
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+        self.has_next = has_more or reverse
+        self.has_previous = position is not None and (has_more or not reverse)
+        self.results = results
+        return results
+
+    def decode_cursor(self, request):
+        """ Разбор курсора вида "<f|r>|<значение ключа>|<id>" в base64. """
+        cursor = request.query_params[self.cursor_query_param]
+        if not cursor:
+            return None
+        try:
+            direction, value, pk = b64decode(
+                cursor.encode(), altchars=b'-_'
+            ).decode().split('|')
+            return direction == 'r', self.parse(value), int(pk)
+        except (DecodeError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, recipe, reverse):
+        """ Построение ссылки на соседнюю страницу от рецепта recipe. """
+        direction = 'r' if reverse else 'f'
+        value = self.format(getattr(recipe, self.field))
+        cursor = b64encode(
+            f'{direction}|{value}|{recipe.id}'.encode(),
+            altchars=b'-_'
+        ).decode()
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(url, self.cursor_query_param, cursor)
 
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.encode_cursor(self.results[-1], False)
+             if self.has_next and self.results else None),
+            ('previous', self.encode_cursor(self.results[0], True)
+             if self.has_previous and self.results else None),
+            ('results', data),
+        ]))
+
+
+class FeedPagination(RecipePagination):
+    """
+    Пагинатор ленты подписок.
+    Всегда работает по ключу (published, id) записей ленты
+    и только вперед: ссылка previous не формируется.
+    Объекты страницы выбираются из кверисета по id записей.
+    """
     def paginate_queryset(self, queryset, request, view=None):
-        recipes_limit = self.get_page_size(request)
-        for recipe in queryset:
-            recipe['recipes'] = recipe['recipes'][:recipes_limit]
-        self.page_size = recipes_limit
-        return super().paginate_queryset(queryset, request, view)
+        self.use_cursor = True
+        self.request = request
+        self.field, self.parse, self.format = self.cursor_fields[None]
+        page_size = self.get_page_size(request)
+        position = None
+        if request.query_params.get(self.cursor_query_param):
+            _, published, pk = self.decode_cursor(request)
+            position = published, pk
+        entries = get_feed_entries(request.user, position, page_size + 1)
+        self.has_next = len(entries) > page_size
+        self.has_previous = False
+        recipes = queryset.in_bulk(
+            [recipe_id for _, recipe_id in entries[:page_size]]
+        )
+        self.results = [
+            recipes[recipe_id]
+            for _, recipe_id in entries[:page_size] if recipe_id in recipes
+        ]
+        return self.results
+
+
+class SubPagination(StandardPagination):
+    """
+    Кастомный пагинатор для сущности подписок пользователя.
+    Страница подписок выбирается в БД по queryparam limit,
+    а queryparam recipes_limit ограничивает количество
+    рецептов каждого автора.
+    """
+    recipes_limit_query_param = 'recipes_limit'
+
+    def get_recipes_limit(self, request):
+        """ Получение ограничения рецептов автора из queryparams. """
+        try:
+            recipes_limit = int(
+                request.query_params[self.recipes_limit_query_param]
+            )
+        except (KeyError, ValueError):
+            return None
+        return recipes_limit if recipes_limit > 0 else None
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from recipes.constants import (POPULARITY_EPOCH, POPULARITY_HALF_LIFE_DAYS,
+                               POPULARITY_WEIGHTS)
+
+EPOCH = datetime.fromisoformat(POPULARITY_EPOCH)
+HALF_LIFE_SECONDS = POPULARITY_HALF_LIFE_DAYS * 24 * 60 * 60
+
+
+def get_contribution(kind, created):
+    """
+    Вклад одного добавления рецепта в избранное или список покупок
+    в его популярность: weight * 2 ^ ((created - epoch) / half_life).
+    Вместо затухания старых добавлений растет вес новых, поэтому порядок
+    рецептов по сумме вкладов на любой момент совпадает с порядком
+    по рейтингу с затуханием, а посчитанные значения не устаревают.
+    """
+    return POPULARITY_WEIGHTS[kind] * 2 ** (
+        (created - EPOCH).total_seconds() / HALF_LIFE_SECONDS
+    )
@@ -0,0 +1,207 @@
+import time
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from itertools import chain
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+from recipes.constants import SEARCH_CONFIG
+from recipes.models import Ingredient, IngredientQuantity
+
+INDEX_TTL = 5 * 60
+CHUNK_SIZE = 10_000
+MAX_CHAR = chr(0x10FFFF)
+
+
+def normalize_name(name):
+    """ Приведение названия к виду для поиска: нижний регистр, ё -> е. """
+    return name.lower().replace('ё', 'е')
+
+
+class ProcessIndex(ABC):
+    """
+    Базовый класс индекса в памяти процесса.
+    Индекс строится методом build при первом обращении, сбрасывается
+    сигналами и перестраивается не реже одного раза в ttl секунд,
+    чтобы изменения из других процессов и bulk-загрузки без сигналов
+    тоже попадали в индекс.
+    """
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._lock = Lock()
+        self._data = None
+        self._generation = 0
+
+    @abstractmethod
+    def build(self):
+        """ Построение данных индекса из БД. """
+
+    def invalidate(self):
+        """ Сброс индекса, он будет перестроен при следующем поиске. """
+        with self._lock:
+            self._generation += 1
+            self._data = None
+
+    def _is_fresh(self, data):
+        return data is not None and time.monotonic() - data[1] < self.ttl
+
+    def _get_data(self):
+        data = self._data
+        if self._is_fresh(data):
+            return data[0]
+        with self._lock:
+            generation = self._generation
+            data = self._data
+        if self._is_fresh(data):
+            return data[0]
+        data = (self.build(), time.monotonic())
+        with self._lock:
+            if generation == self._generation:
+                self._data = data
+        return data[0]
+
+
+class IngredientIndex(ProcessIndex):
+    """
+    Индекс ингредиентов для автодополнения по началу названия.
+    Хранит отсортированный список нормализованных названий,
+    поиск выполняется двоичным поиском без обращения к БД.
+    """
+    def build(self):
+        ingredients = sorted(
+            Ingredient.objects.all(),
+            key=lambda ingredient: (
+                normalize_name(ingredient.name), ingredient.id
+            )
+        )
+        names = [normalize_name(ingredient.name) for ingredient in ingredients]
+        return names, ingredients
+
+    def search(self, prefix, data=None):
+        """ Список ингредиентов, название которых начинается с prefix. """
+        names, ingredients = data or self._get_data()
+        prefix = normalize_name(prefix)
+        start = bisect_left(names, prefix)
+        end = bisect_right(names, prefix + MAX_CHAR, lo=start)
+        return ingredients[start:end]
+
+    async def asearch(self, prefix):
+        """
+        Асинхронный вариант search: индекс берется в потоке
+        для синхронного кода, к БД он обращается только при перестроении.
+        """
+        return self.search(prefix, await sync_to_async(self._get_data)())
+
+
+class RecipeIngredientIndex(ProcessIndex):
+    """
+    Инвертированный индекс ингредиент -> рецепты для подбора рецептов
+    по имеющимся ингредиентам. Для каждого ингредиента хранится
+    компактный массив id рецептов, для каждого рецепта - множество
+    его ингредиентов. Подбор считает совпадения слиянием массивов
+    выбранных ингредиентов без запросов к БД.
+    Изменения рецептов применяются точечно методом update_recipe.
+    """
+    def build(self):
+        recipes = defaultdict(set)
+        quantities = IngredientQuantity.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by()
+        for recipe_id, ingredient_id in quantities.iterator(
+            chunk_size=CHUNK_SIZE
+        ):
+            recipes[recipe_id].add(ingredient_id)
+        postings = defaultdict(lambda: array('q'))
+        for recipe_id, ingredient_ids in recipes.items():
+            for ingredient_id in ingredient_ids:
+                postings[ingredient_id].append(recipe_id)
+        return dict(postings), {
+            recipe_id: frozenset(ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        }
+
+    def update_recipe(self, recipe_id):
+        """
+        Точечное обновление индекса после изменения или удаления рецепта.
+        Незавершенное построение индекса отбрасывается, так как
+        оно могло прочитать данные до изменения.
+        """
+        ingredient_ids = frozenset(IngredientQuantity.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', flat=True))
+        with self._lock:
+            self._generation += 1
+            if self._data is None:
+                return
+            postings, recipes = self._data[0]
+            old_ids = recipes.pop(recipe_id, frozenset())
+            for ingredient_id in old_ids - ingredient_ids:
+                postings[ingredient_id] = array('q', (
+                    pk for pk in postings[ingredient_id] if pk != recipe_id
+                ))
+            for ingredient_id in ingredient_ids - old_ids:
+                postings[ingredient_id] = postings.get(
+                    ingredient_id, array('q')
+                ) + array('q', [recipe_id])
+            if ingredient_ids:
+                recipes[recipe_id] = ingredient_ids
+
+    def match(self, ingredient_ids):
+        """
+        Список рецептов, в которых есть хотя бы один из ингредиентов,
+        в виде (id рецепта, число совпавших, число недостающих),
+        по убыванию доли имеющихся ингредиентов рецепта.
+        """
+        postings, recipes = self._get_data()
+        matched = Counter(chain.from_iterable(
+            postings.get(ingredient_id, ())
+            for ingredient_id in set(ingredient_ids)
+        ))
+        result = []
+        for recipe_id, count in matched.items():
+            required = len(recipes.get(recipe_id, ()))
+            if required >= count:
+                result.append((recipe_id, count, required - count))
+        result.sort(key=lambda item: (
+            -item[1] / (item[1] + item[2]), item[2], -item[0]
+        ))
+        return result
+
+
+ingredient_index = IngredientIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
+
+
+def get_search_vector():
+    """
+    Выражение поискового вектора рецепта: название (вес A),
+    названия ингредиентов (вес B) и текстовое описание (вес C).
+    """
+    ingredient_names = IngredientQuantity.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Subquery(ingredient_names), weight='B', config=SEARCH_CONFIG
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    """
+    Пересчет поискового вектора рецептов кверисета одним UPDATE.
+    Полнотекстовый поиск поддерживается только PostgreSQL.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    queryset.update(search_vector=get_search_vector())
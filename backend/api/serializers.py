@@ -1,11 +1,21 @@
+from django.db import transaction
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from recipes.models import Ingredient, IngredientQuantity, Recipe, Tag
-from rest_framework.serializers import (CharField, ModelSerializer,
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.serializers import (CharField, FloatField, IntegerField,
+                                        ListSerializer, ModelSerializer,
                                         PrimaryKeyRelatedField, ReadOnlyField,
                                         SerializerMethodField, ValidationError)
 from users.models import User
 
+from api.fields import ContentAddressedImageField
+from api.fragments import get_fragments
+from api.images import (SRCSET_FORMAT, THUMB_FORMAT, get_variant_urls,
+                        has_variants)
+from api.utils import bump_recipe_shopping_list_versions, get_followed_ids
+
 #  ===========================================================================
 #                           Часть пользователя
 #  ===========================================================================
@@ -23,10 +33,13 @@ class UserSerializer(DjoserUserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return user in obj.followers.all()
+        """
+        Получение сведений о подписке (True/False) из аннотации
+        или из множества подписок пользователя запроса.
+        """
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in get_followed_ids(self.context.get('request'))
 
 
 class UserSubscribeSerializer(ModelSerializer):
@@ -45,17 +58,26 @@ class UserSubscribeSerializer(ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """ Получение сведений о подписке (True/False). """
-        return self.context.get('user') in obj.followers.all()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in get_followed_ids(self.context.get('request'))
 
     def get_recipes(self, obj):
-        """ Получение и сериализация данных вложенного get_recipes. """
-        recipes = obj.recipes.all()
-        serializer = LimitFieldsRecipeSerializer(recipes, many=True)
+        """
+        Получение и сериализация данных вложенного get_recipes.
+        Если рецепты уже подгружены с ограничением, берутся они.
+        """
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()[:self.context.get('recipes_limit')]
+        serializer = LimitFieldsRecipeSerializer(
+            recipes, many=True, context=self.context
+        )
         return serializer.data
 
     def get_recipes_count(self, obj):
-        """ Получение кол-ва рецептов из запроса. """
-        return obj.recipes.count()
+        """ Получение кол-ва рецептов из счетчика пользователя. """
+        return obj.recipes_count
 
 
 #  ===========================================================================
@@ -66,9 +88,13 @@ class UserSubscribeSerializer(ModelSerializer):
 class IsFavoritedAndInShoppingCartMixin:
     """
     Миксин для проверки сведений о избранном и списке покупок.
+    Если кверисет уже аннотирован признаками, они берутся из объекта
+    без дополнительных запросов.
     """
     def get_is_favorited(self, obj):
         """ Получение сведений о избранном (True/False). """
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -76,12 +102,44 @@ class IsFavoritedAndInShoppingCartMixin:
 
     def get_is_in_shopping_cart(self, obj):
         """ Получение сведений о списке покупок (True/False). """
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return obj.shopping_carts.filter(user=user).exists()
 
 
+class ImageVariantsMixin:
+    """
+    Миксин ссылок на превью картинки рецепта.
+    Пока превью не построены, отдается ссылка на оригинал.
+    """
+    def get_image_url(self, url):
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_image_thumb(self, obj):
+        """ Ссылка на самое маленькое превью в формате JPEG. """
+        if not has_variants(obj):
+            return self.get_image_url(obj.image.url) if obj.image else None
+        urls = get_variant_urls(obj, THUMB_FORMAT)
+        return self.get_image_url(urls[min(urls)])
+
+    def get_image_srcset(self, obj):
+        """ Значение атрибута srcset из превью в формате WebP. """
+        if not has_variants(obj):
+            return None
+        return ', '.join(
+            f'{self.get_image_url(url)} {width}w'
+            for width, url in sorted(
+                get_variant_urls(obj, SRCSET_FORMAT).items()
+            )
+        )
+
+
 class TagSerializer(ModelSerializer):
     """
     Класс-сериализатор для модели Tag.
@@ -110,11 +168,10 @@ class IngredientListSerializer(ModelSerializer):
 class LimitIngridientCreateSerializer(ModelSerializer):
     """
     Класс-сериализатор для создания и обновления рецептов.
+    Ингредиенты по id получаются одним запросом
+    в RecipeCreateChangeDeleteSerializer.validate_ingredients.
     """
-    id = PrimaryKeyRelatedField(
-        source='ingredient.id',
-        queryset=Ingredient.objects.all()
-    )
+    id = IntegerField(source='ingredient.id')
 
     class Meta:
         model = IngredientQuantity
@@ -142,20 +199,58 @@ class IngredientRecipeSerializer(ModelSerializer):
         )
 
 
-class LimitFieldsRecipeSerializer(ModelSerializer):
+class LimitFieldsRecipeSerializer(ModelSerializer, ImageVariantsMixin):
     """
     Класс-сериализатор ограничения полей для модели Recipe.
     """
     image = CharField()
+    image_thumb = SerializerMethodField()
+    image_srcset = SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = (
+            'id', 'name', 'image', 'image_thumb', 'image_srcset',
+            'cooking_time',
+        )
+
+
+class RecipeListSerializer(ListSerializer):
+    """
+    Класс-сериализатор списка рецептов.
+    Не зависящие от пользователя части представлений страницы
+    берутся из кэша одним запросом.
+    """
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        fragments = get_fragments(
+            recipes,
+            self.child.build_fragment,
+            self.child.get_fragment_prefix()
+        )
+        return [
+            self.child.merge_fragment(recipe, fragment)
+            for recipe, fragment in zip(recipes, fragments)
+        ]
 
 
-class RecipeSerializer(ModelSerializer, IsFavoritedAndInShoppingCartMixin):
-    """Класс-сериализатор для модели Recipe."""
+class RecipeSerializer(
+    ModelSerializer, IsFavoritedAndInShoppingCartMixin, ImageVariantsMixin
+):
+    """
+    Класс-сериализатор для модели Recipe.
+    Представление рецепта без признаков пользователя (fragment_fields)
+    кэшируется по id и дате изменения рецепта, признаки избранного,
+    списка покупок и подписки на автора добавляются поверх фрагмента
+    из аннотаций кверисета.
+    """
+    fragment_fields = (
+        'id', 'tags', 'author', 'ingredients', 'name', 'image',
+        'image_thumb', 'image_srcset', 'text', 'cooking_time',
+    )
     image = Base64ImageField()
+    image_thumb = SerializerMethodField()
+    image_srcset = SerializerMethodField()
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer()
     ingredients = IngredientRecipeSerializer(
@@ -170,8 +265,98 @@ class RecipeSerializer(ModelSerializer, IsFavoritedAndInShoppingCartMixin):
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time',
+            'name', 'image', 'image_thumb', 'image_srcset',
+            'text', 'cooking_time',
+        )
+        list_serializer_class = RecipeListSerializer
+
+    def get_fragment_prefix(self):
+        """ Адрес сайта, от которого зависят ссылки на картинки. """
+        request = self.context.get('request')
+        return request.build_absolute_uri('/') if request else ''
+
+    def get_author_subscribed(self, obj):
+        """
+        Получение сведений о подписке на автора (True/False)
+        из аннотации рецепта или, если ее нет, у сериализатора автора.
+        """
+        if not hasattr(obj, 'is_subscribed'):
+            obj.is_subscribed = (
+                obj.author is not None
+                and self.fields['author'].get_is_subscribed(obj.author)
+            )
+        return obj.is_subscribed
+
+    def represent_field(self, field, instance):
+        """ Представление одного поля, как в Serializer.to_representation. """
+        attribute = field.get_attribute(instance)
+        check_for_none = (
+            attribute.pk if isinstance(attribute, PKOnlyObject)
+            else attribute
+        )
+        if check_for_none is None:
+            return None
+        return field.to_representation(attribute)
+
+    def build_fragment(self, instance):
+        """ Представление рецепта без признаков пользователя. """
+        if instance.author is not None:
+            instance.author.is_subscribed = self.get_author_subscribed(
+                instance
+            )
+        fragment = {}
+        for field in self._readable_fields:
+            if field.field_name not in self.fragment_fields:
+                continue
+            try:
+                fragment[field.field_name] = self.represent_field(
+                    field, instance
+                )
+            except SkipField:
+                continue
+        if fragment.get('author'):
+            fragment['author'].pop('is_subscribed')
+        return fragment
+
+    def merge_fragment(self, instance, fragment):
+        """
+        Полное представление рецепта: фрагмент из кэша
+        и поля, зависящие от пользователя и запроса.
+        """
+        data = {}
+        for field in self._readable_fields:
+            name = field.field_name
+            if name == 'author' and fragment.get('author'):
+                data[name] = {
+                    **fragment['author'],
+                    'is_subscribed': self.get_author_subscribed(instance),
+                }
+            elif name in fragment:
+                data[name] = fragment[name]
+            elif name not in self.fragment_fields:
+                try:
+                    data[name] = self.represent_field(field, instance)
+                except SkipField:
+                    continue
+        return data
+
+    def to_representation(self, instance):
+        fragment, = get_fragments(
+            [instance], self.build_fragment, self.get_fragment_prefix()
         )
+        return self.merge_fragment(instance, fragment)
+
+
+class RecipeMatchSerializer(RecipeSerializer):
+    """
+    Класс-сериализатор рецептов, подобранных по ингредиентам.
+    Добавляет долю имеющихся ингредиентов и количество недостающих.
+    """
+    coverage = FloatField(read_only=True)
+    missing = IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('coverage', 'missing')
 
 
 class RecipeCreateChangeDeleteSerializer(
@@ -183,7 +368,7 @@ class RecipeCreateChangeDeleteSerializer(
     Логика валидации полей.
     Логика создания и обновления рецептов.
     """
-    image = Base64ImageField(required=True)
+    image = ContentAddressedImageField(required=True)
     ingredients = LimitIngridientCreateSerializer(
         many=True,
         source='recipe')
@@ -206,28 +391,14 @@ class RecipeCreateChangeDeleteSerializer(
     def to_representation(self, instance):
         """
         Логика переопределения входных и выходных данных.
+        Представление совпадает с RecipeSerializer, при этом после
+        записи теги и ингредиенты берутся из уже провалидированных
+        объектов без повторных запросов в БД.
         """
-        new_representation = super().to_representation(instance)
-
-        tag_ids = new_representation.get('tags', [])
-        tag_objects = Tag.objects.filter(id__in=tag_ids)
-        tag_serializer = TagSerializer(tag_objects, many=True)
-        new_representation['tags'] = tag_serializer.data
-
-        ingredients_data = new_representation.get('ingredients', [])
-        transformed_data = []
-        for ingredient_data in ingredients_data:
-            ingredient_id = ingredient_data['id']
-            ingredient = Ingredient.objects.filter(pk=ingredient_id).first()
-            transformed_data.append({
-                'id': ingredient_id,
-                'name': ingredient.name,
-                'measurement_unit': ingredient.measurement_unit,
-                'amount': ingredient_data['amount']
-            })
-        new_representation['ingredients'] = transformed_data
-
-        return new_representation
+        written = getattr(self, 'written', None)
+        if written is not None:
+            instance._prefetched_objects_cache = dict(written)
+        return RecipeSerializer(instance, context=self.context).data
 
     def validate_image(self, value):
         """ Логика валидации поля image. """
@@ -251,21 +422,32 @@ class RecipeCreateChangeDeleteSerializer(
         return value
 
     def validate_ingredients(self, value):
-        """ Логика валидации поля ингредиентов. """
+        """
+        Логика валидации поля ингредиентов.
+        Все ингредиенты получаются из БД одним запросом.
+        """
         if not value:
             raise ValidationError(
                 'обязательное поле ingredients'
             )
-        unique_ingredients = set()
-        counter_of_income_ingredients = 0
-        for ingredient in value:
-            unique_ingredients.add(ingredient['ingredient']['id'])
-            counter_of_income_ingredients += 1
-        if len(unique_ingredients) != counter_of_income_ingredients:
+        ingredient_ids = [
+            ingredient['ingredient']['id'] for ingredient in value
+        ]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
             raise ValidationError(
                 'Нельзя указывать один и тот же ингредиент несколько раз')
+        ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        for ingredient in value:
+            ingredient_id = ingredient['ingredient']['id']
+            if ingredient_id not in ingredients:
+                raise ValidationError(
+                    f'Недопустимый первичный ключ "{ingredient_id}" - '
+                    'объект не существует.'
+                )
+            ingredient['ingredient']['id'] = ingredients[ingredient_id]
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         """  Логика создания рецептов. """
         tags = validated_data.pop('tags')
@@ -280,18 +462,63 @@ class RecipeCreateChangeDeleteSerializer(
             )
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        for ingredient in ingredients:
-            IngredientQuantity.objects.create(
+        quantities = IngredientQuantity.objects.bulk_create([
+            IngredientQuantity(
                 recipe=recipe,
                 ingredient=ingredient['ingredient']['id'],
                 amount=ingredient.get('amount')
             )
+            for ingredient in ingredients
+        ])
+        recipe.is_favorited = recipe.is_in_shopping_cart = False
+        self.written = {'tags': tags, 'recipe': quantities}
         return recipe
 
+    def update_quantities(self, instance, ingredients):
+        """
+        Обновление ингредиентов рецепта по разнице со старым набором:
+        изменяются только добавленные, удаленные и измененные строки.
+        Возвращает новый набор и признак того, что он изменился.
+        """
+        existing = {}
+        stale = []
+        for quantity in instance.recipe.all():
+            if quantity.ingredient_id in existing:
+                stale.append(quantity)
+            else:
+                existing[quantity.ingredient_id] = quantity
+        quantities, new, changed = [], [], []
+        for ingredient in ingredients:
+            ingredient_obj = ingredient['ingredient']['id']
+            amount = ingredient.get('amount')
+            quantity = existing.pop(ingredient_obj.id, None)
+            if quantity is None:
+                quantity = IngredientQuantity(
+                    recipe=instance,
+                    ingredient=ingredient_obj,
+                    amount=amount
+                )
+                new.append(quantity)
+            elif quantity.amount != amount:
+                quantity.amount = amount
+                changed.append(quantity)
+            quantity.ingredient = ingredient_obj
+            quantities.append(quantity)
+        stale.extend(existing.values())
+        if stale:
+            IngredientQuantity.objects.filter(
+                pk__in=[quantity.pk for quantity in stale]
+            ).delete()
+        IngredientQuantity.objects.bulk_create(new)
+        IngredientQuantity.objects.bulk_update(changed, ['amount'])
+        return quantities, bool(stale or new or changed)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         """ Логика  обновления рецептов. """
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
+        instance.image = validated_data.get('image', instance.image)
         instance.cooking_time = validated_data.get(
             'cooking_time',
             instance.cooking_time
@@ -301,23 +528,15 @@ class RecipeCreateChangeDeleteSerializer(
             raise ValidationError(
                 'при обновлении рецепта нужно указать минимум 1 ингредиент.'
             )
-        clear_flag = False
-
-        for ingredient in ingredients:
-            if 'ingredient' in ingredient:
-                if not clear_flag:
-                    instance.ingredients.clear()
-                    clear_flag = True
-                IngredientQuantity.objects.create(
-                    recipe=instance,
-                    ingredient=ingredient['ingredient']['id'],
-                    amount=ingredient.get('amount')
-                )
         tags = validated_data.get('tags')
         if not tags:
             raise ValidationError(
                 'при обновлении рецепта нужно указать минимум 1 тэг.'
             )
+        quantities, changed = self.update_quantities(instance, ingredients)
+        if changed:
+            bump_recipe_shopping_list_versions(instance)
         instance.tags.set(tags)
         instance.save()
+        self.written = {'tags': tags, 'recipe': quantities}
         return instance
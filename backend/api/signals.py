@@ -0,0 +1,267 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from recipes.models import (FavoriteRecipes, Ingredient, IngredientQuantity,
+                            Recipe, ShoppingCart, Tag)
+from users.models import User, UserSubscription
+
+from api.feed import (backfill_feed, fan_out_recipe, remove_author_from_feeds,
+                      remove_from_feed)
+from api.fragments import AUTHOR_FIELDS, bump_fragment_generation
+from api.images import schedule_variants
+from api.popularity import get_contribution
+from api.search import (ingredient_index, recipe_ingredient_index,
+                        update_search_vectors)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    """ Сброс индекса ингредиентов после фиксации транзакции. """
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+def schedule_search_update(queryset):
+    """
+    Пересчет поискового вектора после фиксации транзакции,
+    когда ингредиенты рецепта уже записаны.
+    """
+    transaction.on_commit(lambda: update_search_vectors(queryset))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(instance, **kwargs):
+    schedule_search_update(Recipe.objects.filter(pk=instance.pk))
+
+
+def is_deleted_with_recipe(kwargs):
+    """
+    Ингредиент рецепта удаляется каскадом вместе с рецептом,
+    обновлять производные данные рецепта не нужно.
+    """
+    return isinstance(kwargs.get('origin'), Recipe)
+
+
+def is_deleted_with_owner(kwargs):
+    """
+    Объект удаляется каскадом вместе с рецептом или пользователем.
+    Счетчики рецепта при этом не нужны, а счетчики и ленты, связанные
+    с удаляемым пользователем, меняются в uncount_user_relations.
+    """
+    return isinstance(kwargs.get('origin'), (Recipe, User))
+
+
+@receiver([post_save, post_delete], sender=IngredientQuantity)
+def update_quantity_search(instance, **kwargs):
+    if is_deleted_with_recipe(kwargs):
+        return
+    schedule_search_update(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def update_recipe_ingredient_index(instance, **kwargs):
+    """ Точечное обновление индекса подбора рецептов по ингредиентам. """
+    recipe_id = instance.pk
+    transaction.on_commit(
+        lambda: recipe_ingredient_index.update_recipe(recipe_id)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(instance, **kwargs):
+    """ Генерация превью картинки рецепта после фиксации транзакции. """
+    transaction.on_commit(lambda: schedule_variants(instance))
+
+
+@receiver([post_save, post_delete], sender=IngredientQuantity)
+def update_quantity_ingredient_index(instance, **kwargs):
+    if is_deleted_with_recipe(kwargs):
+        return
+    recipe_id = instance.recipe_id
+    transaction.on_commit(
+        lambda: recipe_ingredient_index.update_recipe(recipe_id)
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search(instance, created, **kwargs):
+    if not created:
+        schedule_search_update(Recipe.objects.filter(ingredients=instance))
+
+
+def change_counters(model, pk, **deltas):
+    """
+    Атомарное изменение счетчиков одним UPDATE через F().
+    Счетчики не опускаются ниже нуля, расхождения
+    исправляют команды recount и update_popularity.
+    """
+    if pk is None:
+        return
+    model.objects.filter(pk=pk).update(**{
+        field: Greatest(F(field) + delta, Value(0))
+        for field, delta in deltas.items()
+    })
+
+
+def change_counters_many(model, deltas):
+    """
+    Изменение счетчиков нескольких объектов одним UPDATE.
+    deltas - словарь {pk: {поле: изменение}}.
+    """
+    fields = {field for changes in deltas.values() for field in changes}
+    if not fields:
+        return
+    model.objects.filter(pk__in=deltas).update(**{
+        field: Greatest(F(field) + Case(
+            *(
+                When(pk=pk, then=Value(changes[field]))
+                for pk, changes in deltas.items() if field in changes
+            ),
+            default=Value(0),
+            output_field=model._meta.get_field(field)
+        ), Value(0))
+        for field in fields
+    })
+
+
+def get_delta(signal, created=True):
+    """ +1 для созданного объекта, -1 для удаленного, 0 для измененного. """
+    if signal is post_delete:
+        return -1
+    return 1 if created else 0
+
+
+@receiver([post_save, post_delete], sender=FavoriteRecipes)
+def count_favorites(signal, instance, created=True, **kwargs):
+    if is_deleted_with_owner(kwargs):
+        return
+    delta = get_delta(signal, created)
+    if delta:
+        change_counters(
+            Recipe, instance.recipe_id,
+            favorites_count=delta,
+            popularity=delta * get_contribution('favorite', instance.created)
+        )
+
+
+@receiver([post_save, post_delete], sender=ShoppingCart)
+def count_shopping_carts(signal, instance, created=True, **kwargs):
+    if is_deleted_with_owner(kwargs):
+        return
+    delta = get_delta(signal, created)
+    if delta:
+        change_counters(
+            Recipe, instance.recipe_id,
+            shopping_carts_count=delta,
+            popularity=delta * get_contribution(
+                'shopping_cart', instance.created
+            )
+        )
+
+
+@receiver(pre_delete, sender=User)
+def uncount_user_relations(instance, **kwargs):
+    """
+    Вычитание избранного и списков покупок удаляемого пользователя
+    из счетчиков и популярности рецептов, а его подписок и подписчиков
+    из счетчиков других пользователей: по одному UPDATE вместо
+    отдельных запросов на каждую удаляемую каскадом запись.
+    Рецепты автора остаются без автора, поэтому они удаляются
+    из лент подписчиков одним запросом.
+    """
+    deltas = defaultdict(Counter)
+    for kind, model, field in (
+        ('favorite', FavoriteRecipes, 'favorites_count'),
+        ('shopping_cart', ShoppingCart, 'shopping_carts_count'),
+    ):
+        rows = model.objects.filter(user=instance).values_list(
+            'recipe_id', 'created'
+        )
+        for recipe_id, created in rows:
+            deltas[recipe_id][field] -= 1
+            deltas[recipe_id]['popularity'] -= get_contribution(
+                kind, created
+            )
+    change_counters_many(Recipe, deltas)
+    user_deltas = defaultdict(Counter)
+    for follow_to_id in instance.follower.values_list(
+        'follow_to_id', flat=True
+    ):
+        user_deltas[follow_to_id]['followers_count'] -= 1
+    for user_id in instance.follow_to.values_list('user_id', flat=True):
+        user_deltas[user_id]['following_count'] -= 1
+    change_counters_many(User, user_deltas)
+    remove_author_from_feeds(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def count_recipes(signal, instance, created=True, **kwargs):
+    delta = get_delta(signal, created)
+    if delta:
+        change_counters(User, instance.author_id, recipes_count=delta)
+
+
+@receiver([post_save, post_delete], sender=UserSubscription)
+def count_subscriptions(signal, instance, created=True, **kwargs):
+    if is_deleted_with_owner(kwargs):
+        return
+    delta = get_delta(signal, created)
+    if delta:
+        change_counters(User, instance.follow_to_id, followers_count=delta)
+        change_counters(User, instance.user_id, following_count=delta)
+
+
+@receiver(post_save, sender=Recipe)
+def push_to_feeds(instance, created, **kwargs):
+    """ Рассылка нового рецепта по лентам подписчиков автора. """
+    if created:
+        transaction.on_commit(lambda: fan_out_recipe(instance))
+
+
+@receiver([post_save, post_delete], sender=UserSubscription)
+def update_feed(signal, instance, created=True, **kwargs):
+    """ Заполнение и очистка ленты при подписке и отписке. """
+    if is_deleted_with_owner(kwargs):
+        return
+    if signal is post_delete:
+        remove_from_feed(instance.user_id, instance.follow_to_id)
+    elif created:
+        user_id, author_id = instance.user_id, instance.follow_to_id
+        transaction.on_commit(lambda: backfill_feed(user_id, author_id))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_tag_ingredient_fragments(**kwargs):
+    """ Сброс кэша представлений рецептов с тегами и ингредиентами. """
+    bump_fragment_generation()
+
+
+def get_author_values(user):
+    """
+    Значения полей автора, входящих в представления рецептов.
+    Берутся из __dict__, чтобы не загружать отложенные поля.
+    """
+    return {field: user.__dict__.get(field) for field in AUTHOR_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def remember_author_values(instance, **kwargs):
+    instance._author_values = get_author_values(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_fragments(instance, created, **kwargs):
+    """
+    Сброс кэша представлений рецептов, только если при сохранении
+    изменились данные автора, которые в них входят. Смена пароля,
+    даты входа и прочих полей кэш не затрагивает.
+    """
+    values = get_author_values(instance)
+    if not created and values != instance._author_values:
+        bump_fragment_generation()
+    instance._author_values = values
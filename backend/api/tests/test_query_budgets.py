@@ -0,0 +1,222 @@
+import base64
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from recipes.models import Ingredient, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import UserSubscription
+
+from api.factories import generate_data
+from api.middleware import get_query_shape
+from api.search import ingredient_index, recipe_ingredient_index
+
+PAGE_SIZES = (6, 50)
+
+# (название, метод, путь, авторизация, бюджет запросов)
+# {limit} в пути подставляется из PAGE_SIZES: количество запросов
+# не должно расти с размером страницы, иначе в сериализаторе появился N+1.
+# Бюджеты чтения оставляют запас в два запроса над измеренными
+# с холодным кэшем значениями, бюджеты записи - в три.
+READ_BUDGETS = (
+    ('recipes list anonymous', 'get', '/api/recipes/?limit={limit}',
+     False, 7),
+    ('recipes list', 'get', '/api/recipes/?limit={limit}', True, 8),
+    ('recipes by tags', 'get',
+     '/api/recipes/?limit={limit}&tags={tag_slug}', True, 9),
+    ('recipes by author', 'get',
+     '/api/recipes/?limit={limit}&author={author}', True, 9),
+    ('recipes favorited', 'get',
+     '/api/recipes/?limit={limit}&is_favorited=1', True, 8),
+    ('recipes in cart', 'get',
+     '/api/recipes/?limit={limit}&is_in_shopping_cart=1', True, 8),
+    ('recipes search', 'get',
+     '/api/recipes/?limit={limit}&search={word}', True, 8),
+    ('recipes popular', 'get',
+     '/api/recipes/?limit={limit}&ordering=popular', True, 8),
+    ('recipes cursor', 'get', '/api/recipes/?limit={limit}&cursor=',
+     True, 7),
+    ('recipes match', 'get',
+     '/api/recipes/match/?limit={limit}&ingredients={ingredients}',
+     True, 8),
+    ('recipes feed', 'get', '/api/recipes/feed/?limit={limit}', True, 9),
+    ('recipe detail', 'get', '/api/recipes/{recipe}/', True, 8),
+    ('shopping list download', 'get',
+     '/api/recipes/download_shopping_cart/', True, 4),
+    ('shopping list download csv', 'get',
+     '/api/recipes/download_shopping_cart/?type=csv', True, 4),
+    ('users list', 'get', '/api/users/?limit={limit}', True, 6),
+    ('user detail', 'get', '/api/users/{author}/', True, 5),
+    ('user me', 'get', '/api/users/me/', True, 4),
+    ('subscriptions', 'get',
+     '/api/users/subscriptions/?limit={limit}&recipes_limit=3', True, 6),
+    ('tags list', 'get', '/api/tags/', False, 4),
+    ('tag detail', 'get', '/api/tags/{tag}/', False, 3),
+    ('ingredients list', 'get', '/api/ingredients/', False, 4),
+    ('ingredients search', 'get', '/api/ingredients/?name={word}',
+     False, 3),
+    ('ingredient detail', 'get', '/api/ingredients/{ingredient}/',
+     False, 3),
+)
+
+# Запросы, меняющие данные, выполняются по порядку на одном рецепте
+# и одном авторе, в подсчет входят обработчики on_commit.
+WRITE_BUDGETS = (
+    ('recipe create', 'post', '/api/recipes/', 19),
+    ('recipe update', 'patch', '/api/recipes/{new_recipe}/', 17),
+    ('favorite add', 'post', '/api/recipes/{new_recipe}/favorite/', 10),
+    ('favorite delete', 'delete', '/api/recipes/{new_recipe}/favorite/', 8),
+    ('cart add', 'post', '/api/recipes/{new_recipe}/shopping_cart/', 10),
+    ('cart delete', 'delete',
+     '/api/recipes/{new_recipe}/shopping_cart/', 8),
+    ('recipe delete', 'delete', '/api/recipes/{new_recipe}/', 16),
+    ('subscribe', 'post', '/api/users/{not_followed}/subscribe/', 15),
+    ('unsubscribe', 'delete', '/api/users/{not_followed}/subscribe/', 10),
+)
+
+
+def get_image():
+    """ Небольшая картинка в base64 для создания рецепта. """
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+@mock.patch('api.signals.schedule_variants')
+class QueryBudgetTests(TestCase):
+    """
+    Количество запросов к БД каждого эндпоинта API
+    на синтетических данных. Кэш и индексы в памяти сбрасываются
+    перед каждым запросом, поэтому считается худший случай.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media = TemporaryDirectory()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media.name)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        cls.media.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = generate_data(
+            users=500, recipes=3000, ingredients=1000, stdout=StringIO()
+        )
+        cls.token = Token.objects.create(user_id=cls.data['users'][0])
+        followed = set(UserSubscription.objects.filter(
+            user_id=cls.data['users'][0]
+        ).values_list('follow_to_id', flat=True))
+        ingredient = Ingredient.objects.get(pk=cls.data['ingredients'][0])
+        cls.params = {
+            'tag': cls.data['tags'][0],
+            'tag_slug': Tag.objects.get(pk=cls.data['tags'][0]).slug,
+            'author': cls.data['users'][1],
+            'recipe': cls.data['recipes'][0],
+            'ingredient': ingredient.pk,
+            'ingredients': ','.join(map(str, cls.data['ingredients'][:10])),
+            'word': ingredient.name.split()[0],
+            'not_followed': next(
+                pk for pk in cls.data['users'][1:] if pk not in followed
+            ),
+        }
+
+    def setUp(self):
+        authorized = APIClient()
+        authorized.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.clients = {True: authorized, False: APIClient()}
+
+    def get_payload(self, method):
+        """ Тело запроса создания и изменения рецепта. """
+        return {
+            'name': f'Проверка {method}',
+            'text': 'Рецепт для проверки количества запросов',
+            'cooking_time': 10,
+            'image': get_image(),
+            'tags': self.data['tags'][:2],
+            'ingredients': [
+                {'id': pk, 'amount': amount}
+                for amount, pk in enumerate(
+                    self.data['ingredients'][:10 if method == 'post' else 12],
+                    1
+                )
+            ],
+        }
+
+    def request(self, client, method, url, payload=None):
+        """
+        Запрос с подсчетом запросов к БД, включая потоковый ответ
+        и обработчики on_commit. Журнал запросов соединения ограничен,
+        поэтому перед подсчетом он очищается.
+        """
+        cache.clear()
+        ingredient_index.invalidate()
+        recipe_ingredient_index.invalidate()
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = getattr(client, method)(
+                    url, payload, format='json'
+                )
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        return response, queries.captured_queries
+
+    def assertWithinBudget(self, response, queries, budget):
+        self.assertLess(
+            response.status_code, 400, getattr(response, 'data', None)
+        )
+        shapes = {}
+        for query in queries:
+            shape = get_query_shape(query['sql'])
+            shapes[shape] = shapes.get(shape, 0) + 1
+        repeated = '\n'.join(
+            f'{count:>3} x {shape[:150]}'
+            for shape, count in sorted(
+                shapes.items(), key=lambda item: item[1], reverse=True
+            )[:5]
+        )
+        self.assertLessEqual(len(queries), budget, repeated)
+
+    def test_read_budgets(self, schedule_variants):
+        for name, method, path, auth, budget in READ_BUDGETS:
+            sizes = PAGE_SIZES if '{limit}' in path else (None,)
+            counts = []
+            for limit in sizes:
+                url = path.format(limit=limit, **self.params)
+                with self.subTest(name, url=url):
+                    response, queries = self.request(
+                        self.clients[auth], method, url
+                    )
+                    self.assertWithinBudget(response, queries, budget)
+                    counts.append(len(queries))
+            if len(counts) > 1:
+                with self.subTest(name, page_sizes=sizes):
+                    self.assertEqual(len(set(counts)), 1, counts)
+
+    def test_write_budgets(self, schedule_variants):
+        client = self.clients[True]
+        for name, method, path, budget in WRITE_BUDGETS:
+            url = path.format(**self.params)
+            payload = None
+            if name in ('recipe create', 'recipe update'):
+                payload = self.get_payload(method)
+            with self.subTest(name, url=url):
+                response, queries = self.request(client, method, url, payload)
+                if name == 'recipe create':
+                    self.params['new_recipe'] = response.json().get('id')
+                self.assertWithinBudget(response, queries, budget)
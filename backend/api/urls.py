@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api import views
+from api import async_views, views
 
 router = DefaultRouter()
 
@@ -15,3 +16,11 @@ urlpatterns = [
     path('', include(router.urls)),
     path(r'auth/', include('djoser.urls.authtoken')),
 ]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = [
+        path('recipes/', async_views.RecipeListView.as_view()),
+        path('recipes/<int:pk>/', async_views.RecipeDetailView.as_view()),
+        path('tags/', async_views.TagListView.as_view()),
+        path('ingredients/', async_views.IngredientListView.as_view()),
+    ] + urlpatterns
@@ -1,14 +1,38 @@
+import csv
+import time
+
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Sum
-from recipes.models import IngredientQuantity
+from recipes.models import IngredientQuantity, ShoppingCart
+from users.models import UserSubscription
+
+CHUNK_SIZE = 500
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_LIST_GENERATION_KEY = 'shopping_list_generation'
+TASTE_UNIT = 'по вкусу'
+HELLO_MESSAGE = '''
+    Привет!
+    Ниже список продуктов, которые нужно купить для готовки вкусных блюд!\n\n
+    '''
+
+
+class EchoBuffer:
+    """
+    Псевдо-буфер для csv.writer: не хранит данные,
+    а сразу возвращает записанную строку.
+    """
+    def write(self, value):
+        return value
 
 
-def generate_txt_file_with_ingredients(request):
+def get_shopping_list_ingredients(user):
     """
-    Функция получения кверисета ингредиентов и записи файла с данными покупок.
+    Функция получения кверисета ингредиентов из списка покупок
+    пользователя с суммированием повторяющихся позиций.
     """
-    cur_user = request.user
-    ingredients = IngredientQuantity.objects.filter(
-        recipe__shopping_carts__user=cur_user
+    return IngredientQuantity.objects.filter(
+        recipe__shopping_carts__user=user
     ).values(
         'ingredient__name'
     ).annotate(
@@ -19,18 +43,136 @@ def generate_txt_file_with_ingredients(request):
         'ingredient__measurement_unit'
     ).order_by('ingredient__name')
 
-    full_path = 'media/shopping_list.txt'
-    hello_message = '''
-    Привет!
-    Ниже список продуктов, которые нужно купить для готовки вкусных блюд!\n\n
-    '''
-    with open(full_path, 'w+', encoding='utf-8') as file:
-        file.write(hello_message)
-        for ingredient in ingredients:
-            name = ingredient[0]
-            amount = ingredient[1]
-            measurement_unit = ingredient[2]
-            if measurement_unit == 'по вкусу':
-                file.write(f'{name} - {measurement_unit}\n')
-            else:
-                file.write(f'{name} - {amount} - {measurement_unit}\n')
+
+def get_followed_ids(request):
+    """
+    Функция получения множества id авторов, на которых подписан
+    пользователь запроса. Множество выбирается одним запросом
+    и сохраняется в запросе, поэтому все сериализаторы ответа
+    проверяют подписку по нему без обращения к БД.
+    """
+    if request is None or request.user.is_anonymous:
+        return frozenset()
+    followed_ids = getattr(request, 'followed_ids', None)
+    if followed_ids is None:
+        followed_ids = request.followed_ids = frozenset(
+            UserSubscription.objects.filter(
+                user=request.user
+            ).values_list('follow_to_id', flat=True)
+        )
+    return followed_ids
+
+
+def get_shopping_list_version(user_id):
+    """
+    Функция получения версии списка покупок пользователя.
+    Версия состоит из общего поколения списков покупок и версии
+    корзины пользователя. Если часть версии отсутствует в кэше,
+    создается новая, поэтому устаревший список не может быть
+    отдан повторно.
+    """
+    key = f'shopping_list_version:{user_id}'
+    versions = cache.get_many([SHOPPING_LIST_GENERATION_KEY, key])
+    missing = {
+        name: time.time_ns()
+        for name in (SHOPPING_LIST_GENERATION_KEY, key)
+        if name not in versions
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return f'{versions[SHOPPING_LIST_GENERATION_KEY]}:{versions[key]}'
+
+
+def bump_shopping_list_version(*user_ids):
+    """
+    Функция смены версии списка покупок пользователей.
+    Вызывается при любом изменении состава их списка покупок.
+    Версия меняется после фиксации транзакции, чтобы параллельный
+    запрос не закэшировал под новой версией старые данные.
+    """
+    versions = {
+        f'shopping_list_version:{user_id}': None for user_id in user_ids
+    }
+
+    def set_versions():
+        version = time.time_ns()
+        cache.set_many(dict.fromkeys(versions, version), None)
+
+    transaction.on_commit(set_versions)
+
+
+def bump_recipe_shopping_list_versions(recipe):
+    """
+    Функция смены версии списка покупок всех пользователей,
+    добавивших рецепт в список покупок.
+    """
+    user_ids = ShoppingCart.objects.filter(
+        recipe=recipe
+    ).values_list('user_id', flat=True)
+    bump_shopping_list_version(*user_ids)
+
+
+def bump_shopping_list_generation():
+    """
+    Функция смены поколения всех списков покупок.
+    Используется после массовой загрузки данных в обход сигналов,
+    когда неизвестно, чьи списки покупок изменились.
+    """
+    transaction.on_commit(lambda: cache.set(
+        SHOPPING_LIST_GENERATION_KEY, time.time_ns(), None
+    ))
+
+
+def iterate_shopping_list(user):
+    """
+    Генератор строк списка покупок.
+    При наличии в кэше списка для текущей версии корзины он отдается
+    без обращения к БД, иначе курсор БД читается порциями,
+    а результат сохраняется в кэш.
+    """
+    key = (
+        f'shopping_list:{user.pk}:{get_shopping_list_version(user.pk)}'
+    )
+    ingredients = cache.get(key)
+    if ingredients is not None:
+        yield from ingredients
+        return
+    ingredients = []
+    for ingredient in get_shopping_list_ingredients(user).iterator(
+        chunk_size=CHUNK_SIZE
+    ):
+        ingredients.append(ingredient)
+        yield ingredient
+    cache.set(key, ingredients, SHOPPING_LIST_CACHE_TIMEOUT)
+
+
+def generate_txt_lines(ingredients):
+    """
+    Генератор строк списка покупок в формате ".txt".
+    В случае если мера измерения - "по вкусу", количество пропускается.
+    """
+    yield HELLO_MESSAGE
+    for name, amount, measurement_unit in ingredients:
+        if measurement_unit == TASTE_UNIT:
+            yield f'{name} - {measurement_unit}\n'
+        else:
+            yield f'{name} - {amount} - {measurement_unit}\n'
+
+
+def generate_csv_lines(ingredients):
+    """
+    Генератор строк списка покупок в формате ".csv".
+    """
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единицы измерения'))
+    for name, amount, measurement_unit in ingredients:
+        if measurement_unit == TASTE_UNIT:
+            amount = ''
+        yield writer.writerow((name, amount, measurement_unit))
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (generate_txt_lines, 'text/plain; charset=utf-8'),
+    'csv': (generate_csv_lines, 'text/csv; charset=utf-8'),
+}
@@ -1,4 +1,6 @@
-from django.http import FileResponse
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.conf import settings
 from djoser.views import UserViewSet
@@ -7,17 +9,26 @@ from recipes.models import (FavoriteRecipes, Ingredient, Recipe, ShoppingCart,
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.status import HTTP_400_BAD_REQUEST
 from users.models import User, UserSubscription
 
 from api.filters import IngredientFilter, RecipeFilter
-from api.mixins import GetCreateIsExistsObject
-from api.paginators import StandardPagination, SubPagination
+from api.fragments import get_fragment_generation
+from api.mixins import ConditionalGetMixin, GetCreateIsExistsObject
+from api.paginators import (FeedPagination, RecipePagination,
+                            StandardPagination, SubPagination)
 from api.permissions import IsAuthenticatedOrAdminOrAuthor
+from api.search import ingredient_index, recipe_ingredient_index
 from api.serializers import (IngredientListSerializer,
                              LimitFieldsRecipeSerializer,
                              RecipeCreateChangeDeleteSerializer,
-                             RecipeSerializer, TagSerializer, UserSerializer,
+                             RecipeMatchSerializer, RecipeSerializer,
+                             TagSerializer, UserSerializer,
                              UserSubscribeSerializer)
+from api.utils import (SHOPPING_LIST_FORMATS,
+                       bump_recipe_shopping_list_versions,
+                       iterate_shopping_list)
 
 #  ===========================================================================
 #                           Часть пользователя
@@ -59,22 +70,35 @@ class UserViewSet(GetCreateIsExistsObject, UserViewSet):
         permission_classes=[IsAuthenticated, ]
     )
     def subscriptions(self, request):
-        """ Функция для получения списка отслеживаемых авторов."""
+        """
+        Функция для получения списка отслеживаемых авторов.
+        Страница авторов выбирается в БД, количество рецептов
+        берется из счетчика автора, а рецепты авторов подгружаются
+        одним запросом с ограничением recipes_limit через оконную функцию.
+        """
         user = self.get_user(request)
-        user_subscriptions = UserSubscription.objects.filter(user=user)
-        follow_to_users = [
-            subscription.follow_to for subscription in user_subscriptions
-        ]
+        recipes = Recipe.objects.all()
+        recipes_limit = self.paginator.get_recipes_limit(request)
+        if recipes_limit:
+            recipes = recipes.annotate(row_number=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('published').desc(), F('id').desc())
+            )).filter(row_number__lte=recipes_limit)
+        authors = User.objects.filter(
+            follow_to__user=user
+        ).annotate(
+            is_subscribed=Value(True)
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        ).order_by('follow_to__id')
+        page = self.paginate_queryset(authors)
         serializer = UserSubscribeSerializer(
-            follow_to_users,
+            page,
             many=True,
-            context={'user': user}
-        )
-        paginated_data = self.paginator.paginate_queryset(
-            serializer.data,
-            request
+            context={'request': request, 'recipes_limit': recipes_limit}
         )
-        return self.paginator.get_paginated_response(paginated_data)
+        return self.get_paginated_response(serializer.data)
 
     @action(
         methods=['post'],
@@ -107,15 +131,24 @@ class UserViewSet(GetCreateIsExistsObject, UserViewSet):
 #  ===========================================================================
 
 
-class TagModelViewSet(viewsets.ModelViewSet):
+class TagModelViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ Класс-представление для работы  с моделью Tag."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     http_method_names = ['get', ]
 
+    def list(self, request, *args, **kwargs):
+        """ Функция получения списка тегов с поддержкой 304. """
+        return self.conditional_response(
+            request,
+            f'tags-{self.get_model_version(Tag.objects.all())}',
+            lambda: super(TagModelViewSet, self).list(
+                request, *args, **kwargs)
+        )
+
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ Класс-представление для работы  с моделью Ingredient. """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientListSerializer
@@ -123,8 +156,32 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filterset_class = IngredientFilter
     http_method_names = ['get', ]
 
+    def list(self, request, *args, **kwargs):
+        """
+        Функция получения списка ингредиентов.
+        Поиск по началу названия обслуживается индексом в памяти,
+        к фильтрсету с нечетким поиском в БД запрос уходит,
+        только если совпадений по началу названия нет.
+        Полный список отдается с поддержкой 304.
+        """
+        name = request.query_params.get('name')
+        if name:
+            ingredients = ingredient_index.search(name)
+            if ingredients:
+                serializer = self.get_serializer(ingredients, many=True)
+                return Response(serializer.data)
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            request,
+            f'ingredients-{self.get_model_version(Ingredient.objects.all())}',
+            lambda: super(IngredientViewSet, self).list(
+                request, *args, **kwargs)
+        )
+
 
-class RecipeViewSet(GetCreateIsExistsObject, viewsets.ModelViewSet):
+class RecipeViewSet(
+    GetCreateIsExistsObject, ConditionalGetMixin, viewsets.ModelViewSet
+):
     """
     Класс-представление для работы моделью Recipe.
     Определены несколько @action функций с
@@ -136,17 +193,89 @@ class RecipeViewSet(GetCreateIsExistsObject, viewsets.ModelViewSet):
     permission_classes = [
         IsAuthenticatedOrAdminOrAuthor,
     ]
-    pagination_class = StandardPagination
+    pagination_class = RecipePagination
+    cache_control = {'private': True, 'no_cache': True}
     http_method_names = ['get', 'post', 'patch', 'delete']
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        """
+        Функция-построитель кверисета рецептов под текущий запрос.
+        Признаки избранного, списка покупок и подписки на автора
+        вычисляются в SQL. Связанные объекты не подгружаются:
+        представления рецептов берутся из кэша, а для отсутствующих
+        в нем RecipeSerializer подгружает их пачкой, чтобы страница
+        любого размера обходилась фиксированным количеством запросов.
+        """
+        user = self.request.user
+        if user.is_anonymous:
+            return Recipe.objects.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_subscribed=Value(False)
+            )
+        return Recipe.objects.annotate(
+            is_favorited=Exists(FavoriteRecipes.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_subscribed=Exists(UserSubscription.objects.filter(
+                user=user, follow_to=OuterRef('author')))
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Функция получения рецепта с поддержкой 304.
+        Версия рецепта - дата его изменения и признаки текущего
+        пользователя, которые получаются одним запросом.
+        """
+        if not str(kwargs['pk']).isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        version = self.get_version_queryset(kwargs['pk']).first()
+        if version is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            request,
+            self.format_recipe_version(
+                kwargs['pk'], version, get_fragment_generation()
+            ),
+            lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs)
+        )
+
+    def get_version_queryset(self, pk):
+        """ Кверисет версии рецепта без подгрузки самого рецепта. """
+        return self.get_queryset().filter(pk=pk).values_list(
+            'updated', 'is_favorited', 'is_in_shopping_cart', 'is_subscribed'
+        )
+
+    def format_recipe_version(self, pk, version, generation):
+        """
+        Версия представления рецепта для пользователя. Поколение кэша
+        фрагментов меняется при изменении тегов, ингредиентов и профилей
+        авторов, которые не отражаются в дате изменения рецепта.
+        """
+        updated, *flags = version
+        return (
+            f'recipe-{pk}-{updated.timestamp()}-{generation}-'
+            f'{self.request.user.pk}-{flags}'
+        )
+
     def perform_create(self, serializer):
         """
         Функция-заполнения поля автора рецепта после сериализации.
         """
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        """
+        Функция удаления рецепта со сменой версии списков покупок,
+        в которые он был добавлен.
+        """
+        bump_recipe_shopping_list_versions(instance)
+        instance.delete()
+
     def get_serializer_class(self):
         """
         Функция - определитель сериализатора в зависимости от типа запроса.
@@ -217,20 +346,90 @@ class RecipeViewSet(GetCreateIsExistsObject, viewsets.ModelViewSet):
     def download_shopping_cart(self, request):
         """
         Функция для реализации скачивания списка ингридиентов
-        в формате ".txt".
+        в формате ".txt" или ".csv" (queryparam type).
+        Формат ".pdf" не поддерживается: на него, как и на любой
+        неизвестный формат, отдается 400 со списком доступных.
         Реализована логика расчета, повторяющихся ингридиентов,
         В случае если мера измерения - "по вкусу", значение в итоговом
         варианте пропускается.
         Получается пример "Авокадо - по вкусу".
+        Файл не сохраняется на диск, а отдается клиенту потоком
+        по мере чтения данных из БД.
         """
-        from api.utils import generate_txt_file_with_ingredients
-
-        generate_txt_file_with_ingredients(request)
-        file_path = 'media/shopping_list.txt'
-        response = FileResponse(
-            open(file_path, 'rb'), content_type='text/plain'
+        file_format = request.query_params.get('type', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'type': [
+                    f'Формат "{file_format}" не поддерживается. '
+                    f'Доступные форматы: {", ".join(SHOPPING_LIST_FORMATS)}.'
+                ]},
+                status=HTTP_400_BAD_REQUEST
+            )
+        generate_lines, content_type = SHOPPING_LIST_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            generate_lines(iterate_shopping_list(request.user)),
+            content_type=content_type
         )
         response[
             'Content-Disposition'
-        ] = 'attachment; filename="shopping_list.txt"'
+        ] = f'attachment; filename="shopping_list.{file_format}"'
         return response
+
+    @action(
+        methods=['get'],
+        detail=False,
+        pagination_class=StandardPagination,
+        filter_backends=[]
+    )
+    def match(self, request):
+        """
+        Функция подбора рецептов по имеющимся ингредиентам
+        (queryparam ingredients - список id через запятую).
+        Рецепты ранжируются по доле имеющихся ингредиентов и количеству
+        недостающих индексом в памяти, из БД выбирается только
+        текущая страница.
+        """
+        try:
+            ingredient_ids = [
+                int(pk)
+                for value in request.query_params.getlist('ingredients')
+                for pk in value.split(',') if pk
+            ]
+        except ValueError:
+            return Response(status=HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(
+            recipe_ingredient_index.match(ingredient_ids)
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        matched = []
+        for recipe_id, count, missing in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.coverage = count / (count + missing)
+            recipe.missing = missing
+            matched.append(recipe)
+        serializer = RecipeMatchSerializer(
+            matched, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+        filter_backends=[]
+    )
+    def feed(self, request):
+        """
+        Функция получения ленты рецептов авторов, на которых
+        подписан пользователь, от новых к старым.
+        Лента читается из заранее разосланных записей с пагинацией
+        по ключу (queryparam cursor из ссылки next).
+        """
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
@@ -30,6 +30,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_filters',
     'api.apps.ApiConfig',
 ]
@@ -46,6 +47,32 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
 ]
 
+if os.getenv('QUERY_INSTRUMENTATION'):
+    MIDDLEWARE.insert(0, 'api.middleware.QueryInstrumentationMiddleware')
+QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', 5))
+
+# Асинхронные представления чтения подключаются только под ASGI,
+# под WSGI они выполнялись бы через async_to_sync.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == 'True'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'api.images': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
@@ -101,6 +128,15 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.sqlite3',
@@ -0,0 +1,152 @@
+"""
+Конфигурация gunicorn для продакшена.
+Загружается автоматически из рабочей директории (/app в контейнере).
+
+Режим задается переменной GUNICORN_MODE:
+    gthread - воркеры WSGI с пулом потоков GUNICORN_THREADS
+              (по умолчанию);
+    asgi    - воркеры uvicorn с приложением ASGI, асинхронные
+              представления чтения обслуживают параллельные запросы
+              в одном воркере. Остальная работа с БД в воркере
+              выполняется последовательно в одном потоке, поэтому
+              воркеров нужно столько же, сколько потоков в gthread.
+              Хуки pre_request/post_request gunicorn для uvicorn
+              не вызываются, время запросов пишет middleware
+              QUERY_INSTRUMENTATION.
+Количество воркеров считается от доступных процессору ядер
+и может быть задано GUNICORN_WORKERS. Несколько воркеров требуют
+общего для процессов кэша (CACHE_BACKEND/CACHE_LOCATION).
+"""
+import json
+import os
+import time
+
+MODE = os.getenv('GUNICORN_MODE', 'gthread')
+if MODE not in ('asgi', 'gthread'):
+    raise ValueError(f'Неизвестный GUNICORN_MODE: {MODE}')
+
+
+def get_cpu_count():
+    """ Количество ядер, доступных процессу (с учетом cpuset). """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CPU_COUNT = get_cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+if MODE == 'asgi':
+    os.environ.setdefault('ASYNC_VIEWS', 'True')
+    wsgi_app = 'foodgram_backend.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # Синхронный ORM и представления DRF выполняются в воркере
+    # в единственном потоке sync_to_async, поэтому параллельность
+    # работы с БД равна числу воркеров, как число потоков в gthread.
+    threads = 1
+    workers = int(os.getenv(
+        'GUNICORN_WORKERS',
+        (CPU_COUNT * 2 + 1) * int(os.getenv('GUNICORN_THREADS', 4))
+    ))
+else:
+    wsgi_app = 'foodgram_backend.wsgi:application'
+    worker_class = 'gthread'
+    workers = int(os.getenv('GUNICORN_WORKERS', CPU_COUNT * 2 + 1))
+    threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+LOCAL_MEMORY_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def check_shared_cache():
+    """
+    В кэше хранятся версии списков покупок и поколение кэша
+    представлений рецептов. С кэшем в памяти процесса их смена
+    видна только одному воркеру, остальные отдают устаревшие
+    данные до истечения кэша, поэтому такой запуск запрещен.
+    """
+    os.environ.setdefault(
+        'DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings'
+    )
+    from django.conf import settings
+    backend = settings.CACHES['default']['BACKEND']
+    if workers > 1 and backend == LOCAL_MEMORY_CACHE:
+        raise RuntimeError(
+            f'{backend} не разделяется между {workers} воркерами: '
+            'задайте общий кэш в CACHE_BACKEND и CACHE_LOCATION '
+            '(например, Redis) или GUNICORN_WORKERS=1'
+        )
+
+
+check_shared_cache()
+
+# Приложение импортируется до fork, память с кодом и индексами
+# модулей делится между воркерами по copy-on-write.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+# Перезапуск воркеров против роста памяти, разброс не дает
+# воркерам перезапуститься одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Файлы контроля живости воркеров в памяти, а не на overlay-диске
+# контейнера, где запись может подвисать.
+worker_tmp_dir = os.getenv('GUNICORN_WORKER_TMP_DIR', '/dev/shm')
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+
+# Метрики gunicorn (длительность запросов, коды ответов, воркеры)
+# в statsd для дашбордов.
+statsd_host = os.getenv('STATSD_HOST')
+statsd_prefix = os.getenv('STATSD_PREFIX', 'foodgram')
+
+# Запросы длиннее порога дополнительно пишутся с уровнем WARNING.
+SLOW_REQUEST_MS = float(os.getenv('GUNICORN_SLOW_REQUEST_MS', 500))
+
+
+def when_ready(server):
+    server.log.info(
+        f'Режим {MODE}: воркеров {workers}, потоков {threads}, '
+        f'ядер {CPU_COUNT}'
+    )
+
+
+def post_fork(server, worker):
+    """
+    Соединения с БД, открытые при предзагрузке приложения,
+    не должны использоваться несколькими процессами.
+    """
+    if preload_app:
+        from django.db import connections
+        connections.close_all()
+
+
+def pre_request(worker, req):
+    req.start_time = time.perf_counter()
+
+
+def post_request(worker, req, environ, resp):
+    """
+    Время обработки запроса воркером одной JSON-записью в лог.
+    Хуки вызываются воркерами WSGI (gthread), у воркеров uvicorn
+    время запросов отдает middleware QUERY_INSTRUMENTATION.
+    """
+    duration = (time.perf_counter() - req.start_time) * 1000
+    record = json.dumps({
+        'worker': worker.pid,
+        'method': req.method,
+        'path': req.path,
+        'status': resp.status_code,
+        'duration_ms': round(duration, 1),
+    })
+    if duration >= SLOW_REQUEST_MS:
+        worker.log.warning(record)
+    else:
+        worker.log.info(record)
@@ -43,6 +43,7 @@ class RecipeAdmin(admin.ModelAdmin):
               'read_image', 'text',
               'tags', 'cooking_time',)
     list_display = ('name', 'author', 'total_in_favorite', 'published',)
+    list_select_related = ('author',)
     list_filter = ('name',)
     search_fields = ('name',)
     readonly_fields = ('read_image', 'total_in_favorite',)
@@ -56,5 +57,5 @@ class RecipeAdmin(admin.ModelAdmin):
     read_image.short_description = 'Картинка'
 
     def total_in_favorite(self, obj):
-
-        return obj.favorite_recipes.count()
+        return obj.favorites_count
+    total_in_favorite.short_description = 'В избранном'
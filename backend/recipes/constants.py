@@ -5,3 +5,26 @@ LEN_CONSTANTS = {
     'ing_unit': 10,
     'slug_len': 20
 }
+
+POPULAR_ORDERING = 'popular'
+POPULARITY_HALF_LIFE_DAYS = 14
+POPULARITY_EPOCH = '2024-01-01T00:00:00+00:00'
+POPULARITY_WEIGHTS = {
+    'favorite': 1.0,
+    'shopping_cart': 0.5,
+}
+
+SEARCH_CONFIG = 'russian'
+
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+IMAGE_VARIANTS_DIR = 'media/variants/'
+IMAGE_WORKERS = 2
+IMAGE_MAX_SIZE = 5 * 1024 * 1024
+IMAGE_MAX_DIMENSION = 6000
+
+FEED_FANOUT_LIMIT = 10_000
+FEED_BACKFILL_SIZE = 50
@@ -0,0 +1,38 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+PREFIX_INDEX = 'recipes_ingredient_name_lower_prefix'
+TRIGRAM_INDEX = 'recipes_ingredient_name_lower_trgm'
+
+
+def create_indexes(apps, schema_editor):
+    """ Индексы поиска ингредиентов, поддерживаются только PostgreSQL. """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {PREFIX_INDEX} '
+        'ON recipes_ingredient (lower(name) text_pattern_ops)'
+    )
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} '
+        'ON recipes_ingredient USING gin (lower(name) gin_trgm_ops)'
+    )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {PREFIX_INDEX}')
+    schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_remove_favoriterecipes_unique_favorite'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_ingredient_recipe_tag_updated'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-published', '-id'], name='recipe_published_id_idx'),
+        ),
+    ]
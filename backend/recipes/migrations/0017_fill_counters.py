@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'FavoriteRecipes', 'recipe'),
+    ('recipes', 'Recipe', 'shopping_carts_count', 'ShoppingCart', 'recipe'),
+    ('users', 'User', 'recipes_count', 'Recipe', 'author'),
+    ('users', 'User', 'followers_count', 'UserSubscription', 'follow_to'),
+    ('users', 'User', 'following_count', 'UserSubscription', 'user'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    """ Заполнение счетчиков по текущим данным. """
+    for app_label, model_name, field, related_name, fk_field in COUNTERS:
+        model = apps.get_model(app_label, model_name)
+        related_app = 'users' if related_name == 'UserSubscription' else (
+            'recipes'
+        )
+        related_model = apps.get_model(related_app, related_name)
+        model.objects.update(**{field: Coalesce(Subquery(
+            related_model.objects.filter(
+                **{fk_field: OuterRef('pk')}
+            ).order_by().values(fk_field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_counters'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations
+
+OLD_PREFIX_INDEX = 'recipes_ingredient_name_lower_prefix'
+OLD_TRIGRAM_INDEX = 'recipes_ingredient_name_lower_trgm'
+PREFIX_INDEX = 'recipes_ingredient_name_search_prefix'
+TRIGRAM_INDEX = 'recipes_ingredient_name_search_trgm'
+SEARCH_NAME = "replace(lower(name), 'ё', 'е')"
+
+
+def create_indexes(apps, schema_editor):
+    """
+    Индексы поиска ингредиентов по названию в нижнем регистре
+    с заменой ё на е, как в индексе ингредиентов в памяти.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {OLD_PREFIX_INDEX}')
+    schema_editor.execute(f'DROP INDEX IF EXISTS {OLD_TRIGRAM_INDEX}')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {PREFIX_INDEX} '
+        f'ON recipes_ingredient (({SEARCH_NAME}) text_pattern_ops)'
+    )
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} '
+        f'ON recipes_ingredient USING gin (({SEARCH_NAME}) gin_trgm_ops)'
+    )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {PREFIX_INDEX}')
+    schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX}')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {OLD_PREFIX_INDEX} '
+        'ON recipes_ingredient (lower(name) text_pattern_ops)'
+    )
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {OLD_TRIGRAM_INDEX} '
+        'ON recipes_ingredient USING gin (lower(name) gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
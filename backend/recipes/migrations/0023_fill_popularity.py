@@ -0,0 +1,41 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+from api.popularity import get_contribution
+
+BATCH_SIZE = 1000
+
+
+def fill_popularity(apps, schema_editor):
+    """
+    Заполнение популярности рецептов по текущему избранному
+    и спискам покупок, как в команде update_popularity.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    scores = defaultdict(float)
+    for kind, model_name in (
+        ('favorite', 'FavoriteRecipes'), ('shopping_cart', 'ShoppingCart')
+    ):
+        rows = apps.get_model('recipes', model_name).objects.values_list(
+            'recipe_id', 'created'
+        )
+        for recipe_id, created in rows.iterator(chunk_size=BATCH_SIZE):
+            scores[recipe_id] += get_contribution(kind, created)
+    recipes = Recipe.objects.filter(pk__in=scores).only('id', 'popularity')
+    changed = []
+    for recipe in recipes.iterator(chunk_size=BATCH_SIZE):
+        recipe.popularity = scores[recipe.id]
+        changed.append(recipe)
+    Recipe.objects.bulk_update(changed, ['popularity'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_ingredient_name_normalized_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_popularity, migrations.RunPython.noop),
+    ]
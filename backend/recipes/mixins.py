@@ -0,0 +1,17 @@
+class CountersModelMixin:
+    """
+    Миксин моделей со счетчиками и другими вычисляемыми полями,
+    которые меняются только запросами UPDATE.
+    При сохранении уже существующего объекта эти поля не записываются,
+    чтобы не затереть значения, измененные параллельными запросами.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
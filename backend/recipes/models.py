@@ -1,13 +1,17 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db.models import (CASCADE, SET_NULL, CharField, ForeignKey,
-                              ImageField, ManyToManyField, Model,
-                              PositiveSmallIntegerField, SlugField, TextField,
-                              Index, DateTimeField,)
+from django.db.models import (CASCADE, SET_NULL, CharField, FloatField,
+                              ForeignKey, ImageField, JSONField,
+                              ManyToManyField, Model, PositiveIntegerField,
+                              PositiveSmallIntegerField,
+                              SlugField, TextField, Index, DateTimeField,
+                              UniqueConstraint,)
 from users.models import User
 from recipes.constants import LEN_CONSTANTS as LC
+from recipes.mixins import CountersModelMixin
 
 
-class Recipe(Model):
+class Recipe(CountersModelMixin, Model):
     author = ForeignKey(
         User, on_delete=SET_NULL,
         related_name='recipes',
@@ -16,6 +20,9 @@ class Recipe(Model):
     )
     name = CharField('Название рецепта', max_length=LC['name'])
     image = ImageField('Картинка', upload_to='media/')
+    image_variants = JSONField(
+        'Превью картинки', default=dict, editable=False
+    )
     text = TextField('Текстовое описание рецепта')
     ingredients = ManyToManyField(
         'Ingredient',
@@ -39,11 +46,37 @@ class Recipe(Model):
         ]
     )
     published = DateTimeField('Дата публикации', auto_now_add=True)
+    updated = DateTimeField('Дата изменения', auto_now=True)
+    favorites_count = PositiveIntegerField(
+        'Количество добавлений в избранное', default=0, editable=False
+    )
+    shopping_carts_count = PositiveIntegerField(
+        'Количество добавлений в список покупок', default=0, editable=False
+    )
+    popularity = FloatField(
+        'Популярность', default=0, editable=False
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор', null=True, editable=False
+    )
+
+    counter_fields = (
+        'favorites_count', 'shopping_carts_count', 'popularity',
+        'search_vector', 'image_variants'
+    )
 
     class Meta:
         ordering = ('-published',)
         indexes = [
             Index(fields=['id']),
+            Index(
+                fields=['-published', '-id'],
+                name='recipe_published_id_idx'
+            ),
+            Index(
+                fields=['-popularity', '-id'],
+                name='recipe_popularity_id_idx'
+            ),
         ]
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
@@ -68,6 +101,7 @@ class AbstractUserAuthorModel(Model):
         on_delete=CASCADE,
         verbose_name='Рецепт блюда'
     )
+    created = DateTimeField('Дата добавления', auto_now_add=True)
 
     class Meta:
         abstract = True
@@ -96,12 +130,54 @@ class ShoppingCart(AbstractUserAuthorModel):
         '''
 
 
+class FeedEntry(Model):
+    """
+    Запись ленты подписок пользователя.
+    Создается для каждого подписчика автора при публикации рецепта,
+    поэтому лента читается по индексу без соединения подписок
+    с рецептами.
+    """
+    user = ForeignKey(
+        User,
+        on_delete=CASCADE,
+        related_name='feed_entries',
+        verbose_name='пользователь'
+    )
+    recipe = ForeignKey(
+        Recipe,
+        on_delete=CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт блюда'
+    )
+    published = DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            Index(
+                fields=['user', '-published', '-recipe'],
+                name='feed_user_published_idx'
+            ),
+        ]
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'лента подписок'
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
 class Ingredient(Model):
     name = CharField('Название', max_length=LC['name'])
     measurement_unit = CharField(
         'Единицы измерения',
         max_length=LC['ing_unit']
     )
+    updated = DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         ordering = ('id',)
@@ -145,6 +221,7 @@ class Tag(Model):
     name = CharField('Название', max_length=LC['name'], unique=True)
     color = CharField('Цветовой код', unique=True, max_length=LC['color_len'])
     slug = SlugField('Слаг', unique=True, max_length=LC['slug_len'])
+    updated = DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         verbose_name = 'тэг'
@@ -22,11 +22,6 @@ class UserAdmin(admin.ModelAdmin):
     search_fields = ('username',)
     ordering = ('-date_joined',)
 
-    def recipes_count(self, obj):
-        return obj.recipes.count()
-
-    recipes_count.short_description = 'Количество опубликованных рецептов'
-
     def has_add_permission(self, request):
         return True
 
@@ -35,6 +30,7 @@ class UserAdmin(admin.ModelAdmin):
 class SubscriptionAdmin(admin.ModelAdmin):
     fields = ('user', 'follow_to')
     list_display = ('user', 'total_subscribers', 'total_subscriptions',)
+    list_select_related = ('user', 'follow_to')
     search_fields = ('user',)
 
     def has_delete_permission(self, request, obj=None):
@@ -46,12 +42,12 @@ class SubscriptionAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(
             request
-        ).distinct('follower').order_by('follower')
+        ).distinct('user').order_by('user')
 
     def total_subscribers(self, obj):
-        return obj.user.follow_to.count()
+        return obj.user.followers_count
     total_subscribers.short_description = 'Количество подписчиков'
 
     def total_subscriptions(self, obj):
-        return obj.follow_to.follower.count()
+        return obj.follow_to.following_count
     total_subscriptions.short_description = 'Количество подписок'
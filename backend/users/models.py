@@ -2,11 +2,12 @@ from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from django.db.models import (CASCADE, BooleanField, CharField, DateTimeField,
                               EmailField, ForeignKey, ManyToManyField, Model,
-                              UniqueConstraint)
+                              PositiveIntegerField, UniqueConstraint)
 from recipes.constants import LEN_CONSTANTS as LC
+from recipes.mixins import CountersModelMixin
 
 
-class User(AbstractUser):
+class User(CountersModelMixin, AbstractUser):
     username = CharField(
         'Ник-нейм',
         validators=[RegexValidator('^[\\w.@+-]+\\Z')],
@@ -36,6 +37,17 @@ class User(AbstractUser):
         'self', through='UserSubscription',
         related_name='followers', symmetrical=False
     )
+    recipes_count = PositiveIntegerField(
+        'Количество опубликованных рецептов', default=0, editable=False
+    )
+    followers_count = PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False
+    )
+    following_count = PositiveIntegerField(
+        'Количество подписок', default=0, editable=False
+    )
+
+    counter_fields = ('recipes_count', 'followers_count', 'following_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', ]